@@ -4,10 +4,6 @@ This file demonstrates how to use the improved API system.
 """
 import logging
 from pathlib import Path
-from PIL import Image
-
-# Setup logging to see debug output
-logging.basicConfig(level=logging.DEBUG)
 
 # Import the new managers
 from observer_ward.history_manager import HistoryManager, HistoryEntry
@@ -218,6 +214,9 @@ def example_integrated_usage():
 
 def main():
     """Run all examples."""
+    # Setup logging to see debug output
+    logging.basicConfig(level=logging.DEBUG)
+
     print("\n" + "="*80)
     print("OBSERVER WARD - NEW API FEATURES EXAMPLES")
     print("="*80 + "\n")
@@ -2,13 +2,15 @@ import sys
 import os
 import time
 import json
+import atexit
+import queue
 import logging
 import threading
+import concurrent.futures
+from collections import deque
+from functools import partial
 from pathlib import Path
 from typing import List, Dict, Optional, Tuple, Any
-from datetime import datetime
-from rich.panel import Panel
-from rich.console import Console
 
 try:
     from dotenv import load_dotenv
@@ -16,13 +18,35 @@ try:
 except ImportError:
     print("dotenv not found, please install dependencies.")
 
+# Shared runtime helpers (console, interrupts, history I/O, display)
+from observer_ward.runtime import (
+    CONFIG_FILE,
+    HISTORY_FILE,
+    HistoryWriter,
+    _json_dumps,
+    _json_loads,
+    chat_active,
+    console,
+    consume_interrupts,
+    display_comment,
+    flush_input,
+    FLAG_CHAT,
+    FLAG_MENU,
+    load_history,
+    maybe_time,
+    request_chat,
+    request_menu,
+    setup_keyboard_listener,
+    sleep_until_next,
+)
+
 # Import modules
 from observer_ward.config import AppConfig
 from observer_ward.metrics import METRICS
 from observer_ward.utils import setup_logging, save_error_screenshot
 from observer_ward.screenshot import Screenshotter
-from observer_ward.hashing import DETECTOR
-from observer_ward.api import init_apis, analyze_with_gemini, with_retry
+from observer_ward.hashing import DETECTOR, HASH_THUMB_SIZE
+from observer_ward.api import init_apis, analyze_with_gemini, encode_screenshot, with_retry
 
 # Import new UI system
 from observer_ward.ui import run_ui_selection
@@ -35,33 +59,23 @@ STYLES_FILE = Path(__file__).parent / "styles.json"
 def load_styles() -> Dict[str, str]:
     if STYLES_FILE.exists():
         try:
-            with open(STYLES_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return _json_loads(STYLES_FILE.read_bytes())
         except Exception as e:
             print(f"Failed to load styles.json: {e}")
     return {}
 
 ALL_STYLES = load_styles()
 
-def list_styles() -> List[str]:
-    return list(ALL_STYLES.keys())
-
-# Constants
-# Constants
-# We are now in observer_ward package, so root is parent.parent
-HISTORY_FILE = Path(__file__).parent.parent.resolve() / ".ai_commentator_history.json"
-CONFIG_FILE = Path(__file__).parent.parent.resolve() / "config.json"
-
-# Console for application output
-console = Console(emoji=False, force_terminal=True, color_system="truecolor")
-
-# Global pause flags
-pause_for_menu = threading.Event()
-pause_for_chat = threading.Event()
-chat_active = threading.Event()
-interrupt_event = threading.Event()  # Master event for waking up sleeping threads
-
+# Style keys and the numbered menu mapping never change after load, so
+# build them once instead of re-deriving titles on every menu open
+_STYLE_KEYS = tuple(ALL_STYLES.keys())
+MENU_STYLES: Dict[str, Tuple[str, str]] = {
+    str(i): (k.replace('_', ' ').title(), k)
+    for i, k in enumerate(_STYLE_KEYS, 1)
+}
 
+def list_styles() -> List[str]:
+    return list(_STYLE_KEYS)
 
 class ModelContainer:
     """Thread-safe container for the Gemini model to allow runtime reloading."""
@@ -78,134 +92,69 @@ class ModelContainer:
             return self.model
 
 
-def setup_keyboard_listener():
-    """Sets up global hotkeys for menu and chat."""
-    def on_menu():
-        console.print("[bold magenta]Hotkey Detected: Menu[/bold magenta]")
-        pause_for_menu.set()
-        interrupt_event.set()
-        
-    def on_chat():
-        console.print("[bold magenta]Hotkey Detected: Chat[/bold magenta]")
-        pause_for_chat.set()
-        interrupt_event.set()
-
-    # Use GlobalHotKeys for reliable modifier handling
-    try:
-        from pynput import keyboard
-        # Define hotkeys: <ctrl>+<alt>+x for Menu, <ctrl>+<alt>+c for Chat
-        hotkeys = keyboard.GlobalHotKeys({
-            '<ctrl>+<alt>+x': on_menu,
-            '<ctrl>+<alt>+c': on_chat
-        })
-        hotkeys.start()
-        return True
-    except Exception as e:
-        console.print(f"[red]Failed to setup global hotkeys: {e}[/red]")
-        return False
-
-
-def load_history() -> List[Dict[str, str]]:
-    """
-    Load commentary history from the history file.
-    
-    Returns:
-        List of history entries with timestamp and comment fields.
-    """
-    if HISTORY_FILE.exists():
-        try:
-            with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError) as e:
-            logging.warning(f"Failed to load history: {e}")
-            return []
-    return []
+def observer_loop(overlay, config, model_container, style_prompt, history, persona_manager, history_writer, stop_event):
+    """Background loop for screen analysis. Exits when stop_event is set."""
+    # Producer/consumer split: a worker thread captures and hashes frames
+    # at interval pace, so the (multi-second) Gemini call in this loop
+    # never delays the next capture.
+    frame_queue: "queue.Queue[Tuple[str, Any, Any, str]]" = queue.Queue(maxsize=2)
+    capture_stop = threading.Event()
 
+    # Shared across the worker and the chat callback; Screenshotter keeps
+    # one mss context per thread internally
+    screenshotter = Screenshotter()
 
-def save_history(history: List[Dict[str, str]]) -> None:
-    """
-    Save commentary history to the history file.
-    
-    Args:
-        history: List of history entries to save.
-    """
-    try:
-        # Limit history to last 50 entries to keep file compact
-        history = history[-50:]
-        with open(HISTORY_FILE, 'w', encoding='utf-8') as f:
-            json.dump(history, f, ensure_ascii=False, indent=4)
-    except IOError as e:
-        logging.error(f"Failed to save history: {e}")
+    def _capture_worker():
+        # Contexts are released by observer_loop's close_all() at teardown
+        while not capture_stop.is_set():
+            capture_start = time.monotonic()
+            # time.strftime avoids building a datetime object per frame
+            now_str = time.strftime("%H:%M:%S")
+
+            # Slow captures/hashes (>100ms) are logged at DEBUG; at
+            # production log levels maybe_time never touches the clock
+            with maybe_time("Screenshot"):
+                screenshot, thumb = screenshotter.take_screenshot_with_thumb(
+                    monitor_index=config.screenshot_monitor_index,
+                    width=config.screenshot_width,
+                    height=config.screenshot_height,
+                    thumb_size=HASH_THUMB_SIZE
+                )
 
+            if screenshot:
+                with maybe_time("Hash"):
+                    h = DETECTOR.compute_hash(thumb, method=config.hash_method)
+                    decision = DETECTOR.decide_change(h, config)
+
+                item = (now_str, screenshot, h, decision)
+                try:
+                    frame_queue.put_nowait(item)
+                except queue.Full:
+                    # Drop the oldest frame; the consumer is behind
+                    METRICS.record_dropped_frame()
+                    try:
+                        frame_queue.get_nowait()
+                    except queue.Empty:
+                        pass
+                    try:
+                        frame_queue.put_nowait(item)
+                    except queue.Full:
+                        pass
 
-def sleep_until_next(iteration_start: float, interval_seconds: float, interrupt_event: threading.Event = None) -> bool:
-    """
-    Sleep until the next iteration should begin, interruptible by a master event.
-    
-    Args:
-        iteration_start: Monotonic timestamp when the iteration started.
-        interval_seconds: Target interval between iterations.
-        interrupt_event: Master event that signals wake-up (replaces polling list).
-        
-    Returns:
-        True if interrupted by event, False if timeout completed.
-    """
-    elapsed = time.monotonic() - iteration_start
-    timeout = max(0, interval_seconds - elapsed)
-    
-    if timeout > 0:
-        if interrupt_event:
-            # Efficient wait using OS primitives instead of polling
-            if interrupt_event.wait(timeout):
-                interrupt_event.clear()  # Clear immediately to prevent busy loop
-                return True
-            return False
-        else:
-            time.sleep(timeout)
-            return False
-    return False
+            elapsed = time.monotonic() - capture_start
+            capture_stop.wait(max(0, config.interval_seconds - elapsed))
 
+    capture_thread = threading.Thread(target=_capture_worker, daemon=True)
+    capture_thread.start()
 
-def display_comment(comment: str, now_str: str, is_cached: bool = False) -> None:
-    """
-    Display a comment in a formatted panel.
-    
-    Args:
-        comment: The comment text to display.
-        now_str: Timestamp string for the panel title.
-        is_cached: Whether this comment is from cache.
-    """
-    console.rule()
-    title = f"[dim]{now_str} (cached)[/dim]" if is_cached else f"[dim]{now_str}[/dim]"
-    console.print(Panel(
-        comment,
-        title=title,
-        style="white on black",
-        border_style="bright_blue",
-        expand=False
-    ))
-
-
-def flush_input():
-    """Flush stdin buffer to remove queued keystrokes"""
     try:
-        import msvcrt
-        while msvcrt.kbhit():
-            msvcrt.getch()
-    except ImportError:
-        pass
+        while not stop_event.is_set():
+            # Drain pending interrupts in one locked read; flags set after
+            # this point survive until the next pass
+            flags = consume_interrupts()
 
-
-def observer_loop(overlay, config, model_container, style_prompt, history, persona_manager):
-    """Background loop for screen analysis"""
-    # Initialize Screenshotter
-    screenshotter = Screenshotter()
-    
-    try:
-        while True:
             # Check for menu request
-            if pause_for_menu.is_set():
-                pause_for_menu.clear()
+            if flags & FLAG_MENU:
                 console.print("\n[cyan]═══ Menu/Settings Requested ═══[/cyan]\n")
                 # Trigger GUI settings
                 overlay.show_settings()
@@ -213,34 +162,35 @@ def observer_loop(overlay, config, model_container, style_prompt, history, perso
                 console.print("[cyan]═══ Resumed ═══[/cyan]\n")
 
             # Check for chat request
-            if pause_for_chat.is_set():
-                pause_for_chat.clear()
-                
+            if flags & FLAG_CHAT:
+
                 def on_chat_submit(message):
                     """Callback for overlay chat input"""
                     if not message:
                         return
                         
                     console.print(f"[dim]Chat: {message}[/dim]")
-                    
-                    # Take fresh screenshot for chat context
-                    # Use a new Screenshotter instance to avoid thread conflicts with the main loop
-                    chat_screenshotter = Screenshotter()
-                    try:
-                        chat_screenshot = chat_screenshotter.take_screenshot(
-                            monitor_index=config.screenshot_monitor_index,
-                            width=config.screenshot_width,
-                            height=config.screenshot_height
-                        )
-                    finally:
-                        chat_screenshotter.close()
+
+                    # Take fresh screenshot for chat context; the shared
+                    # Screenshotter keeps a reusable context for this thread
+                    chat_screenshot = screenshotter.take_screenshot(
+                        monitor_index=config.screenshot_monitor_index,
+                        width=config.screenshot_width,
+                        height=config.screenshot_height
+                    )
                     
                     if chat_screenshot:
+                        # Encode once; retries then resend the same bytes
+                        chat_img_bytes = encode_screenshot(
+                            chat_screenshot,
+                            quality=config.screenshot_jpeg_quality,
+                            max_edge=config.vision_max_edge)
                         # Run analysis directly (we are already in a background thread)
                         comment = with_retry(
-                            lambda: analyze_with_gemini(
+                            partial(
+                                analyze_with_gemini,
                                 model_container.get(),
-                                chat_screenshot,
+                                chat_img_bytes,
                                 config,
                                 style_prompt=style_prompt,
                                 history=history,
@@ -252,12 +202,14 @@ def observer_loop(overlay, config, model_container, style_prompt, history, perso
                         
                         if comment:
                             # Display on overlay and console
+                            now_str = time.strftime("%H:%M:%S")
                             overlay.display_comment(comment)
-                            display_comment(comment, datetime.now().strftime("%H:%M:%S"), is_cached=False)
-                            
+                            display_comment(comment, now_str, is_cached=False)
+
                             DETECTOR.cache_set(comment, config.cache_ttl_seconds, config.disable_cache)
-                            history.append({"timestamp": datetime.now().strftime("%H:%M:%S"), "comment": comment})
-                            save_history(history)
+                            entry = {"timestamp": now_str, "comment": comment}
+                            history.append(entry)
+                            history_writer.submit(entry)
                         else:
                             console.print("[red]Failed to generate chat response.[/red]")
                             overlay.display_comment("Error: Could not generate response.")
@@ -266,38 +218,17 @@ def observer_loop(overlay, config, model_container, style_prompt, history, perso
                 overlay.show_input(on_chat_submit)
                 console.print("[cyan]Chat input opened on overlay[/cyan]")
             
-            iteration_start = time.monotonic()
-            now_str = datetime.now().strftime("%H:%M:%S")
-
-            # Profiling: Screenshot
-            t0 = time.monotonic()
-            screenshot = screenshotter.take_screenshot(
-                monitor_index=config.screenshot_monitor_index,
-                width=config.screenshot_width,
-                height=config.screenshot_height
-            )
-            t1 = time.monotonic()
-            
-            if not screenshot:
-                if sleep_until_next(iteration_start, config.interval_seconds, interrupt_event):
-                    continue
+            # Debounced config flush picks up menu/settings changes
+            config.flush_if_dirty(CONFIG_FILE)
+
+            # Wait for the next captured frame; the short timeout keeps
+            # menu/chat requests responsive while the queue is idle
+            try:
+                now_str, screenshot, h, decision = frame_queue.get(timeout=0.5)
+            except queue.Empty:
                 continue
 
-            # Profiling: Hashing
-            t2 = time.monotonic()
-            h = DETECTOR.compute_hash(screenshot, method=config.hash_method)
-            decision = DETECTOR.decide_change(h, config)
-            t3 = time.monotonic()
-            
-            # Log slow operations (>100ms)
-            screenshot_time = (t1 - t0) * 1000
-            hash_time = (t3 - t2) * 1000
-            if screenshot_time > 0 or hash_time > 0:
-                 logging.info(f"Perf: Screenshot={screenshot_time:.1f}ms, Hash={hash_time:.1f}ms")
-
             if decision == "skip":
-                if sleep_until_next(iteration_start, config.interval_seconds, interrupt_event):
-                    continue
                 continue
 
             if decision == "use_cache":
@@ -305,17 +236,24 @@ def observer_loop(overlay, config, model_container, style_prompt, history, perso
                 if cached:
                     overlay.display_comment(cached)
                     display_comment(cached, now_str, is_cached=True)
-                    if sleep_until_next(iteration_start, config.interval_seconds, interrupt_event):
-                        continue
                     continue
 
             if decision == "call":
                 request_start = time.monotonic()
-                
+
+                # Encode once; retries resend the same bytes, and an
+                # unchanged frame hash reuses the previous encode outright
+                img_bytes = DETECTOR.get_or_encode(
+                    h,
+                    partial(encode_screenshot, screenshot,
+                            quality=config.screenshot_jpeg_quality,
+                            max_edge=config.vision_max_edge)
+                )
                 comment = with_retry(
-                    lambda: analyze_with_gemini(
+                    partial(
+                        analyze_with_gemini,
                         model_container.get(),
-                        screenshot,
+                        img_bytes,
                         config,
                         style_prompt=style_prompt,
                         history=history,
@@ -325,26 +263,27 @@ def observer_loop(overlay, config, model_container, style_prompt, history, perso
                 )
                 
                 request_latency = time.monotonic() - request_start
-                logging.info(f"Gemini complete request latency: {request_latency:.3f}s")
-                console.print(f"[dim]Latency: {request_latency:.3f}s[/dim]")
+                # %-formatting defers the string build to enabled levels;
+                # plain stdout skips Rich's markup parse for this hot line
+                logging.info("Gemini complete request latency: %.3fs", request_latency)
+                sys.stdout.write(f"Latency: {request_latency:.3f}s\n")
 
                 if comment:
                     overlay.display_comment(comment)
                     display_comment(comment, now_str, is_cached=False)
                     DETECTOR.cache_set(comment, config.cache_ttl_seconds, config.disable_cache)
-                    history.append({"timestamp": now_str, "comment": comment})
-                    save_history(history)
+                    entry = {"timestamp": now_str, "comment": comment}
+                    history.append(entry)
+                    history_writer.submit(entry)
 
-            # Sleep at end of loop
-            if sleep_until_next(iteration_start, config.interval_seconds, interrupt_event):
-                continue
-                
     except Exception as e:
         console.print(f"\n[red]Critical Error in Observer Loop: {e}[/red]")
         logging.exception("Critical error in observer loop")
         save_error_screenshot()
     finally:
-        screenshotter.close()
+        capture_stop.set()
+        screenshotter.close_all()
+        history_writer.commit()
 
 
 def main() -> None:
@@ -356,39 +295,26 @@ def main() -> None:
     logger = setup_logging(Path(config.log_path))
     logger.info("AI Commentator started")
     
-    # 3. Init API
-    model = init_apis(config)
-    # We allow starting without a model now, so user can set key in settings
-    if not model:
-        console.print("[yellow]Gemini API not initialized. Please set API Key in Settings (Ctrl+Alt+M).[/yellow]")
-    
-    model_container = ModelContainer(model)
+    # 3. Init API on a warmup thread; the style menu below blocks on user
+    # input, so model construction overlaps it for free. init_apis caches
+    # per (model, key), making the post-menu call a lookup.
+    warmup_thread = threading.Thread(target=init_apis, args=(config,), daemon=True)
+    warmup_thread.start()
+
+    model_container = ModelContainer(None)
 
     def reload_model(new_key: str):
         """Updates API key and reloads the model."""
+        # Re-saving the current key from settings is a no-op; skip the
+        # .env rewrite and model re-init entirely
+        if new_key == os.environ.get("GEMINI_API_KEY") and model_container.get() is not None:
+            return True
         try:
-            # 1. Update .env file
-            env_path = Path(".env")
-            lines = []
-            if env_path.exists():
-                with open(env_path, "r", encoding="utf-8") as f:
-                    lines = f.readlines()
-            
-            key_found = False
-            new_lines = []
-            for line in lines:
-                if line.startswith("GEMINI_API_KEY="):
-                    new_lines.append(f"GEMINI_API_KEY={new_key}\n")
-                    key_found = True
-                else:
-                    new_lines.append(line)
-            
-            if not key_found:
-                new_lines.append(f"GEMINI_API_KEY={new_key}\n")
-                
-            with open(env_path, "w", encoding="utf-8") as f:
-                f.writelines(new_lines)
-            
+            # 1. Update .env file; set_key handles quoting/escaping and
+            # replaces the manual read/rewrite scan
+            from dotenv import set_key, find_dotenv
+            set_key(find_dotenv() or ".env", "GEMINI_API_KEY", new_key)
+
             # 2. Update Environment Variable
             os.environ["GEMINI_API_KEY"] = new_key
             
@@ -407,23 +333,32 @@ def main() -> None:
 
     # 4. Setup keyboard listener for runtime menu access
     has_menu_hotkey = setup_keyboard_listener()
+
+    # Load history in the background while the user sits in the style
+    # menu; the deque built after selection is the sole in-memory source
+    # of truth for the rest of the session (the file is never re-read).
+    history_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    history_future = history_executor.submit(
+        load_history, config.max_history_entries)
     
-    # 5. Prepare Styles
-    menu_styles: Dict[str, Tuple[str, str]] = {}
-    if list_styles:
-        keys = list_styles()
-        for i, k in enumerate(keys, 1):
-            title = k.replace('_', ' ').title()
-            menu_styles[str(i)] = (title, k)
+    # 5. Styles are precomputed at module load (MENU_STYLES)
 
     # 6. Run New UI System (single Live context!)
-    current_style, interval = run_ui_selection(menu_styles, config)
+    current_style, interval = run_ui_selection(MENU_STYLES, config)
     if not current_style:
         console.print("[yellow]Exiting...[/yellow]")
         return
 
     style_name, style_key = current_style
     style_prompt = ALL_STYLES.get(style_key, "")
+
+    # Pick up the warmed model (cache hit if the warmup finished)
+    warmup_thread.join()
+    model = init_apis(config)
+    # We allow starting without a model now, so user can set key in settings
+    if not model:
+        console.print("[yellow]Gemini API not initialized. Please set API Key in Settings (Ctrl+Alt+M).[/yellow]")
+    model_container.update(model)
     
     # Record usage for statistics
     from observer_ward.style_persistence import STYLE_MANAGER
@@ -436,22 +371,34 @@ def main() -> None:
     else:
         console.print("[dim]Press Ctrl+C to stop[/dim]\n")
     
-    # Update config with runtime choices and save
+    # Update config with runtime choices; the write is deferred so menu
+    # tweaks don't each pay a full JSON rewrite
     config.interval_seconds = interval
-    config.save(CONFIG_FILE)
-    
-    history = load_history()
+    config.mark_dirty()
     
+    # Bounded deque so memory and prompt-building cost stay O(maxlen)
+    # regardless of how long the session runs
+    history = deque(history_future.result(),
+                    maxlen=config.max_history_entries)
+    history_executor.shutdown(wait=False)
+
+    # Background writer so the observer loop never blocks on history I/O;
+    # atexit covers exit paths that skip the finally blocks
+    history_writer = HistoryWriter()
+    atexit.register(history_writer.commit)
+
     # Initialize Persona Manager
     persona_manager = PersonaManager(HISTORY_FILE)
     
     # Initialize Overlay
     overlay = Overlay(config, api_key_callback=reload_model)
 
-    # Start observer loop in background thread
+    # Start observer loop in background thread; stop_event lets it wind
+    # down cooperatively so Screenshotter contexts are actually closed
+    stop_event = threading.Event()
     observer_thread = threading.Thread(
         target=observer_loop,
-        args=(overlay, config, model_container, style_prompt, history, persona_manager),
+        args=(overlay, config, model_container, style_prompt, history, persona_manager, history_writer, stop_event),
         daemon=True
     )
     observer_thread.start()
@@ -467,6 +414,10 @@ def main() -> None:
         console.print(f"\n[red]Critical Error: {e}[/red]")
         logging.exception("Critical error in main")
     finally:
+        stop_event.set()
+        observer_thread.join(timeout=2.0)
+        config.flush_if_dirty(CONFIG_FILE, min_interval=0.0)
+        history_writer.commit()
         if 'persona_manager' in locals():
             persona_manager.end_session()
             console.print("[dim]Session saved to memory.[/dim]")
@@ -0,0 +1,37 @@
+"""
+Optional Numba-accelerated perceptual hash kernels.
+
+Used by hashing.ChangeDetector when numba is installed; callers fall
+back to plain imagehash otherwise.
+"""
+import logging
+import numpy as np
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    logging.info("numba not installed. Using pure-Python perceptual hashing.")
+
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True, fastmath=True)
+    def dhash_bits(gray):
+        """Horizontal-gradient bits over a small grayscale grid.
+
+        Matches imagehash.dhash's definition (right pixel > left pixel)
+        so the resulting hashes stay comparable.
+        """
+        h, w = gray.shape
+        bits = np.empty((h, w - 1), dtype=np.bool_)
+        for y in range(h):
+            for x in range(w - 1):
+                bits[y, x] = gray[y, x] < gray[y, x + 1]
+        return bits
+
+    # Warm the JIT at import time so the first frame doesn't pay the
+    # compile cost
+    dhash_bits(np.zeros((8, 9), dtype=np.uint8))
+else:
+    dhash_bits = None
@@ -0,0 +1,41 @@
+"""JSON helpers backed by orjson when available.
+
+orjson parses and serializes several times faster than the stdlib and
+emits UTF-8 bytes directly (no separate encode pass over Cyrillic-heavy
+payloads). These wrappers fall back to the stdlib so the dependency
+stays optional.
+"""
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    def loads(data: Any) -> Any:
+        """Parse JSON from str or bytes."""
+        return orjson.loads(data)
+
+    def dumps(obj: Any) -> str:
+        """Serialize to a compact JSON string."""
+        return orjson.dumps(obj).decode('utf-8')
+
+    def dumps_bytes(obj: Any, indent: bool = False) -> bytes:
+        """Serialize to UTF-8 JSON bytes, optionally indented."""
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+else:
+    def loads(data: Any) -> Any:
+        """Parse JSON from str or bytes."""
+        return json.loads(data)
+
+    def dumps(obj: Any) -> str:
+        """Serialize to a compact JSON string."""
+        return json.dumps(obj, ensure_ascii=False)
+
+    def dumps_bytes(obj: Any, indent: bool = False) -> bytes:
+        """Serialize to UTF-8 JSON bytes, optionally indented."""
+        return json.dumps(
+            obj, ensure_ascii=False, indent=2 if indent else None
+        ).encode('utf-8')
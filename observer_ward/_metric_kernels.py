@@ -0,0 +1,34 @@
+"""
+Optional Numba-accelerated metric kernels.
+
+Used by metrics.LatencyRing when numba is installed; callers fall back
+to plain numpy otherwise.
+"""
+import logging
+import numpy as np
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    logging.info("numba not installed. Using numpy for latency quantiles.")
+
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True)
+    def three_kth(a, k0, k1, k2):
+        """k-th smallest elements of a contiguous float64 window.
+
+        Three selection passes over a copy of the input — O(n) each,
+        no full sort, no Python-level iteration.
+        """
+        return (np.partition(a, k0)[k0],
+                np.partition(a, k1)[k1],
+                np.partition(a, k2)[k2])
+
+    # Warm the JIT at import time so the first stats read doesn't pay
+    # the compile cost
+    three_kth(np.zeros(4, dtype=np.float64), 0, 1, 2)
+else:
+    three_kth = None
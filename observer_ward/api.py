@@ -1,48 +1,186 @@
 import os
 import json
+import asyncio
 import logging
+import random
+import threading
 import time
-import base64
 from io import BytesIO
-from typing import Optional, List, Dict, Any, Callable, TypeVar
+from typing import Optional, List, Dict, Any, Callable, Tuple, TypeVar
 from PIL import Image
 import google.generativeai as genai
 from google.generativeai.generative_models import GenerativeModel
 from .config import AppConfig
+from ._jsonfast import loads as json_loads
 
 T = TypeVar("T")
 
+# Models already constructed this session, keyed by (model name, key).
+# Makes init_apis idempotent so it can run early on a warmup thread and
+# again at the normal call site for free.
+_MODEL_CACHE: Dict[str, GenerativeModel] = {}
+
 def init_apis(config: AppConfig) -> Optional[GenerativeModel]:
-    """Initializes the Gemini API."""
+    """Initializes the Gemini API. Idempotent per (model, key) pair."""
     gem_key = os.getenv("GEMINI_API_KEY", "")
     if not gem_key:
         print("GEMINI_API_KEY not set")
         return None
-        
+
+    cache_key = f"{config.gemini_model}:{gem_key}"
+    cached = _MODEL_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+
     try:
         os.environ["GEMINI_API_KEY"] = gem_key
         model = GenerativeModel(config.gemini_model)
+        _MODEL_CACHE[cache_key] = model
         print(f"[OK] Gemini Vision ({config.gemini_model}) connected")
         return model
     except Exception as e:
         print(f"Gemini API Error: {e}")
         return None
 
+# Transient failures worth retrying: rate limits, server-side errors and
+# network hiccups. Anything else (bad key, invalid argument, schema
+# errors) fails the same way every attempt, so retrying only burns the
+# budget and delays the error.
+try:
+    from google.api_core import exceptions as gapi_exceptions
+    RETRYABLE_EXCEPTIONS = (
+        gapi_exceptions.ResourceExhausted,
+        gapi_exceptions.ServiceUnavailable,
+        gapi_exceptions.DeadlineExceeded,
+        gapi_exceptions.InternalServerError,
+        ConnectionError,
+        TimeoutError,
+    )
+    RATE_LIMIT_EXCEPTIONS = (gapi_exceptions.ResourceExhausted,)
+except ImportError:
+    RETRYABLE_EXCEPTIONS = (ConnectionError, TimeoutError)
+    RATE_LIMIT_EXCEPTIONS = ()
+
+class RateLimiter:
+    """Client-side admission control for Gemini calls.
+
+    A token bucket sized by the per-minute quota plus a daily counter,
+    so calls that would certainly 429 are refused before any bytes go
+    out. The refill rate adapts AIMD-style: an EWMA of observed 429s
+    slows the bucket multiplicatively while the server is pushing back
+    and recovers as successes come in.
+    """
+    def __init__(self, minute_limit: int, day_limit: int):
+        self.minute_limit = max(1, minute_limit)
+        self.day_limit = max(1, day_limit)
+        self.tokens = float(self.minute_limit)
+        self.last_refill = time.monotonic()
+        self.day_count = 0
+        self._day_epoch = -1
+        self.ewma_429 = 0.0
+        self._lock = threading.Lock()
+
+    def _roll_day(self) -> None:
+        # Epoch-day int compare, same scheme as MetricsManager._roll_day
+        day = int(time.time() // 86400)
+        if day != self._day_epoch:
+            self._day_epoch = day
+            self.day_count = 0
+
+    def try_acquire(self) -> bool:
+        """Takes one call token; False means the call should be skipped."""
+        with self._lock:
+            self._roll_day()
+            if self.day_count >= self.day_limit:
+                return False
+            now = time.monotonic()
+            # Congestion-scaled refill: a rising 429 EWMA slows the bucket
+            rate_per_sec = (self.minute_limit / 60.0) / (1.0 + self.ewma_429)
+            self.tokens = min(
+                float(self.minute_limit),
+                self.tokens + (now - self.last_refill) * rate_per_sec
+            )
+            self.last_refill = now
+            if self.tokens < 1.0:
+                return False
+            self.tokens -= 1.0
+            self.day_count += 1
+            return True
+
+    def record_result(self, rate_limited: bool) -> None:
+        """Feeds an observed outcome into the congestion estimate."""
+        with self._lock:
+            alpha = 0.3
+            signal = 1.0 if rate_limited else 0.0
+            self.ewma_429 = alpha * signal + (1.0 - alpha) * self.ewma_429
+
+_RATE_LIMITER: Optional[RateLimiter] = None
+
+def get_rate_limiter(config: AppConfig) -> RateLimiter:
+    """Returns the process-wide limiter, built from config on first use."""
+    global _RATE_LIMITER
+    if _RATE_LIMITER is None:
+        _RATE_LIMITER = RateLimiter(config.minute_limit, config.day_limit)
+    return _RATE_LIMITER
+
+def _retry_after_hint(exc: Exception) -> Optional[float]:
+    """Extracts a server-suggested retry delay from an exception, if any.
+
+    Rate-limit errors from google.api_core carry either a retry_after
+    attribute or a google.rpc RetryInfo retry_delay.
+    """
+    hint = getattr(exc, 'retry_after', None)
+    if hint is None:
+        retry_delay = getattr(exc, 'retry_delay', None)
+        if retry_delay is not None:
+            hint = getattr(retry_delay, 'seconds', None)
+    try:
+        return float(hint) if hint is not None else None
+    except (TypeError, ValueError):
+        return None
+
 def with_retry(func: Callable[[], T], config: AppConfig) -> Optional[T]:
-    """Executes a function with retry logic."""
+    """Executes a function with retry logic.
+
+    Backoff is exponential with +/-50% jitter so concurrent clients
+    don't retry in lockstep after a shared 429 burst; a server-provided
+    Retry-After hint overrides the computed delay. Delays are capped at
+    config.retry_max_delay.
+    """
     max_attempts = config.retry_max_attempts
     if config.disable_retries:
         max_attempts = 1
-        
+
     initial_delay = config.retry_initial_delay
     backoff = config.retry_backoff_factor
-    
+    max_delay = getattr(config, 'retry_max_delay', 60.0)
+    limiter = get_rate_limiter(config)
+
     for attempt in range(max_attempts):
+        if not limiter.try_acquire():
+            print("Client-side rate limit reached, skipping call")
+            logging.warning("Client-side rate limit reached; call skipped")
+            return None
         try:
-            return func()
+            result = func()
+            limiter.record_result(False)
+            return result
         except Exception as e:
+            limiter.record_result(isinstance(e, RATE_LIMIT_EXCEPTIONS))
+            if not isinstance(e, RETRYABLE_EXCEPTIONS):
+                print(f"Non-retryable error: {e}")
+                logging.error(f"Non-retryable API error: {e}")
+                return None
             if attempt < max_attempts - 1:
-                delay = initial_delay * (backoff ** attempt) if not config.disable_retries else 0
+                if config.disable_retries:
+                    delay = 0
+                else:
+                    base = initial_delay * (backoff ** attempt)
+                    delay = random.uniform(base * 0.5, base * 1.5)
+                    hinted = _retry_after_hint(e)
+                    if hinted is not None:
+                        delay = hinted
+                    delay = min(delay, max_delay)
                 if delay > 0:
                     print(f"Attempt {attempt+1} failed, retrying in {delay:.1f}s...")
                     logging.warning(f"Attempt {attempt+1} failed: {e}")
@@ -56,8 +194,165 @@ def with_retry(func: Callable[[], T], config: AppConfig) -> Optional[T]:
                 return None
     return None
 
-def analyze_with_gemini(model: GenerativeModel, 
-                       screenshot: Image.Image, 
+SCREENSHOT_MIME_TYPE = "image/jpeg"
+
+# Per-thread scratch buffer for JPEG encoding; reusing it keeps the
+# buffer sized to the largest frame seen instead of re-growing a fresh
+# BytesIO through realloc on every encode.
+_BUF_POOL = threading.local()
+
+def encode_screenshot(screenshot: Image.Image, quality: int = 75,
+                      max_edge: Optional[int] = None) -> bytes:
+    """Encodes a screenshot to JPEG bytes.
+
+    JPEG at moderate quality is 5-10x smaller than PNG for screen
+    content, shrinking the upload body accordingly. Call this once
+    before wrapping analyze_with_gemini in with_retry so transient
+    failures retry only the API call, not the image encode.
+
+    Args:
+        screenshot: Frame to encode.
+        quality: JPEG quality setting.
+        max_edge: If set, downscale so the long edge fits this many
+            pixels. Gemini tiles inputs to ~768px, so pixels beyond that
+            only cost encode CPU, upload bytes and extra image tiles.
+    """
+    if max_edge and max(screenshot.size) > max_edge:
+        scale = max_edge / max(screenshot.size)
+        new_size = (max(1, round(screenshot.width * scale)),
+                    max(1, round(screenshot.height * scale)))
+        screenshot = screenshot.resize(new_size, Image.Resampling.LANCZOS)
+    # Screenshotter frames are already RGB; only convert when a caller
+    # hands us an alpha/palette image, so the common path skips a full
+    # frame copy
+    if screenshot.mode != "RGB":
+        screenshot = screenshot.convert("RGB")
+    buf = getattr(_BUF_POOL, 'buf', None)
+    if buf is None:
+        buf = BytesIO()
+        _BUF_POOL.buf = buf
+    buf.seek(0)
+    buf.truncate()
+    screenshot.save(buf, format="JPEG", quality=quality)
+    return buf.getvalue()
+
+def maybe_analyze(model: GenerativeModel,
+                  screenshot: Image.Image,
+                  config: AppConfig,
+                  detector: Optional[Any] = None,
+                  **kwargs) -> Tuple[str, Optional[str]]:
+    """Fused hash -> decide -> encode -> call helper.
+
+    Enforces the cheap-first ordering for simple callers: the frame is
+    hashed and the change decision made before any JPEG encode, so
+    stable screens ("skip"/"use_cache") never pay the encoding pipeline.
+    The observer loop implements this same ordering across its worker
+    threads; this helper is the single-threaded equivalent.
+
+    Args:
+        model: Gemini model instance
+        screenshot: Raw PIL frame (not pre-encoded)
+        config: App configuration
+        detector: ChangeDetector to use (defaults to the global one)
+        **kwargs: Forwarded to analyze_with_gemini
+
+    Returns:
+        (decision, comment) — comment is None on "skip" or API failure.
+    """
+    from functools import partial
+    from .hashing import DETECTOR
+
+    detector = detector if detector is not None else DETECTOR
+    h = detector.compute_hash(screenshot, method=config.hash_method)
+    decision = detector.decide_change(h, config)
+
+    if decision == "skip":
+        return decision, None
+    if decision == "use_cache":
+        return decision, detector.cache_get(config.disable_cache)
+
+    img_bytes = detector.get_or_encode(
+        h,
+        partial(encode_screenshot, screenshot,
+                quality=getattr(config, 'screenshot_jpeg_quality', 75),
+                max_edge=getattr(config, 'vision_max_edge', None))
+    )
+    comment = with_retry(
+        partial(analyze_with_gemini, model, img_bytes, config, **kwargs),
+        config
+    )
+    if comment:
+        detector.cache_set(comment, config.cache_ttl_seconds, config.disable_cache)
+    return decision, comment
+
+def analyze_batch(model: GenerativeModel,
+                  screenshots: List[Any],
+                  config: AppConfig,
+                  style_prompt: Optional[str] = None) -> List[Optional[str]]:
+    """
+    Analyzes several screenshots in one Gemini request.
+
+    Prompt and system overhead are paid once for the whole batch, so
+    per-image latency drops versus one request per frame. Intended for
+    offline/bulk callers; the live observer loop stays one-frame-per-
+    request so comments track the screen in real time.
+
+    Args:
+        model: Gemini model instance
+        screenshots: Frames to analyze (PIL Images or pre-encoded bytes)
+        config: App configuration
+        style_prompt: Style/persona instruction
+
+    Returns:
+        One comment (or None) per input frame, in order.
+    """
+    if not screenshots:
+        return []
+    try:
+        user_text = ""
+        if style_prompt:
+            user_text += f"PERSONA: {style_prompt}\n\n"
+        user_text += (
+            "[YOUR PRIMARY TASK]:\n"
+            f"Analyze each of the {len(screenshots)} images below, in order.\n"
+            "\nOUTPUT FORMAT: Return a JSON array with one object per image, "
+            "each with fields: comment, mood_update, intensity\n"
+        )
+
+        parts: List[Dict[str, Any]] = [{"text": user_text}]
+        for shot in screenshots:
+            img_bytes = shot if isinstance(shot, bytes) else encode_screenshot(shot)
+            parts.append({"inline_data": {"mime_type": SCREENSHOT_MIME_TYPE, "data": img_bytes}})
+
+        response = model.generate_content(
+            [{"role": "user", "parts": parts}],
+            generation_config=genai.types.GenerationConfig(
+                temperature=config.temperature,
+                max_output_tokens=config.max_output_tokens,
+                response_mime_type="application/json"
+            )
+        )
+
+        try:
+            results = json_loads(response.text)
+        except ValueError:
+            logging.warning(f"Failed to parse batch JSON response: {response.text}")
+            return [None] * len(screenshots)
+
+        if not isinstance(results, list):
+            results = [results]
+        comments: List[Optional[str]] = [
+            r.get("comment") if isinstance(r, dict) else None for r in results
+        ]
+        # Pad/trim so callers can zip against their inputs
+        comments += [None] * (len(screenshots) - len(comments))
+        return comments[:len(screenshots)]
+    except Exception:
+        logging.exception("Batch analysis failed")
+        return [None] * len(screenshots)
+
+def analyze_with_gemini(model: GenerativeModel,
+                       screenshot: Any,
                        config: AppConfig,
                        style_prompt: Optional[str] = None, 
                        history: Optional[List[Dict]] = None,
@@ -71,7 +366,7 @@ def analyze_with_gemini(model: GenerativeModel,
     
     Args:
         model: Gemini model instance
-        screenshot: Image to analyze
+        screenshot: Image to analyze (PIL Image or pre-encoded PNG bytes)
         config: App configuration
         style_prompt: Style/persona instruction
         history: (DEPRECATED) Raw history list - use history_manager instead
@@ -84,146 +379,270 @@ def analyze_with_gemini(model: GenerativeModel,
         Comment string or None on error
     """
     try:
-        # Lazy imports to avoid circular dependencies
-        from .token_counter import TokenCounter
-        
-        # Encode image
-        buf = BytesIO()
-        screenshot.save(buf, format="PNG")
-        img_bytes = buf.getvalue()
-        img_base64 = base64.b64encode(img_bytes).decode()
-        
-        # Initialize prompt manager if not provided
-        if prompt_manager is None:
-            from .prompts import PromptManager
-            prompt_manager = PromptManager()
-        
-        # Build prompt components
-        persona_instruction = f"PERSONA: {style_prompt}" if style_prompt else ""
-        
-        persona_context = ""
-        if persona_manager and getattr(config, 'use_persona_context', True):
-            persona_context = persona_manager.get_context_prompt()
-        
-        history_display = ""
-        if getattr(config, 'use_history_context', True):
-            # Use new HistoryManager if provided, otherwise fall back to old method
-            if history_manager:
-                history_display = history_manager.get_context_for_prompt(
-                    max_comments=3,
-                    max_tokens=500
-                )
-            elif history:
-                # DEPRECATED: Old method for backwards compatibility
-                recent_history = history[-5:]
-                history_items = []
-                for h in recent_history:
-                    if isinstance(h, dict) and h.get('comment'):
-                        history_items.append(h.get('comment'))
-                
-                if history_items:
-                    last_comments = history_items[-3:]
-                    history_display = "\n".join([f'  {i+1}. "{c}"' for i, c in enumerate(last_comments)])
-        
-        # Use prompt manager to build final prompt
+        # Encode image (accepts pre-encoded bytes from call sites that
+        # hoist the encode out of retry loops). Raw bytes go straight to
+        # the SDK, which base64s once at the transport layer — no extra
+        # string copy of the whole image here.
+        img_bytes = screenshot if isinstance(screenshot, bytes) else encode_screenshot(screenshot)
+
+        contents, generation_config = _build_request(
+            img_bytes, config, style_prompt, history, user_message,
+            persona_manager, history_manager, prompt_manager
+        )
+
+        # Call Gemini API, streaming so we can stop reading as soon as
+        # the JSON payload closes instead of waiting for stream teardown
+        response = model.generate_content(
+            contents,
+            generation_config=generation_config,
+            stream=True
+        )
+        text = _read_streamed_json(response)
+        return _parse_comment_text(
+            text, user_message, persona_manager, history_manager)
+
+    except Exception as e:
+        raise e
+
+def _read_streamed_json(stream: Any) -> str:
+    """Drains a streamed response, stopping once the JSON parses.
+
+    The comment payload is a single small JSON object; once it closes
+    there is nothing left worth waiting for, so checking parseability
+    after each chunk that contains a '}' lets us abandon the stream a
+    round-trip early. Parse attempts are gated on '}' so mid-object
+    chunks cost no json work.
+    """
+    pieces: List[str] = []
+    for chunk in stream:
+        chunk_text = getattr(chunk, 'text', '') or ''
+        pieces.append(chunk_text)
+        if '}' not in chunk_text:
+            continue
+        text = ''.join(pieces)
         try:
-            user_text = prompt_manager.build_analysis_prompt(
-                persona_instruction=persona_instruction,
-                persona_context=persona_context,
-                history_display=history_display,
-                user_message=user_message or "",
-                include_anti_repetition=getattr(config, 'use_anti_repetition', True)
+            json_loads(text)
+        except ValueError:
+            continue
+        return text
+    return ''.join(pieces)
+
+def _build_request(img_bytes: bytes,
+                   config: AppConfig,
+                   style_prompt: Optional[str],
+                   history: Optional[List[Dict]],
+                   user_message: Optional[str],
+                   persona_manager: Any,
+                   history_manager: Optional[Any],
+                   prompt_manager: Optional[Any]) -> Tuple[List[Dict], Any]:
+    """Builds the (contents, generation_config) pair for an analysis call.
+
+    Shared between the sync and async entry points so the prompt
+    assembly logic exists exactly once.
+    """
+    # Initialize prompt manager if not provided
+    if prompt_manager is None:
+        from .prompts import PromptManager
+        prompt_manager = PromptManager()
+    
+    # Build prompt components
+    persona_instruction = f"PERSONA: {style_prompt}" if style_prompt else ""
+    
+    persona_context = ""
+    if persona_manager and getattr(config, 'use_persona_context', True):
+        persona_context = persona_manager.get_context_prompt()
+    
+    history_display = ""
+    if getattr(config, 'use_history_context', True):
+        # Use new HistoryManager if provided, otherwise fall back to old method
+        if history_manager:
+            history_display = history_manager.get_context_for_prompt(
+                max_comments=3,
+                max_tokens=500
             )
-        except Exception as e:
-            logging.warning(f"PromptManager failed, falling back to manual prompt: {e}")
-            # Fallback to old method if PromptManager fails
-            user_text = ""
-            if style_prompt:
-                user_text += f"PERSONA: {style_prompt}\n\n"
-            if persona_context:
-                user_text += f"{persona_context}\n\n"
-            user_text += """[YOUR PRIMARY TASK]:
+        elif history:
+            # DEPRECATED: Old method for backwards compatibility
+            # list() so deque-backed histories can be sliced
+            recent_history = list(history)[-5:]
+            history_items = []
+            for h in recent_history:
+                if isinstance(h, dict) and h.get('comment'):
+                    history_items.append(h.get('comment'))
+            
+            if history_items:
+                last_comments = history_items[-3:]
+                history_display = "\n".join([f'  {i+1}. "{c}"' for i, c in enumerate(last_comments)])
+    
+    # Use prompt manager to build final prompt
+    try:
+        user_text = prompt_manager.build_analysis_prompt(
+            persona_instruction=persona_instruction,
+            persona_context=persona_context,
+            history_display=history_display,
+            user_message=user_message or "",
+            include_anti_repetition=getattr(config, 'use_anti_repetition', True)
+        )
+    except Exception as e:
+        logging.warning(f"PromptManager failed, falling back to manual prompt: {e}")
+        # Fallback to old method if PromptManager fails.
+        # Static sections first (stable prefix for prompt caching),
+        # volatile content (mood, history, user message) last.
+        user_text = ""
+        if style_prompt:
+            user_text += f"PERSONA: {style_prompt}\n\n"
+        user_text += """[YOUR PRIMARY TASK]:
 Analyze THIS image you are seeing RIGHT NOW.
 """
-            if history_display:
-                user_text += f"\n[WHAT YOU ALREADY SAID]:\n{history_display}\n"
-            if user_message:
-                user_text += f"\n[USER MESSAGE]: {user_message}\n"
-            user_text += "\nOUTPUT FORMAT: Return a JSON object with fields: comment, mood_update, intensity"
-        
-        # Debug logging with token count
-        if logging.getLogger().isEnabledFor(logging.DEBUG):
-            debug_output = "\n" + "="*80 + "\n"
-            debug_output += "FULL PROMPT SENT TO GEMINI API\n"
-            debug_output += "="*80 + "\n"
-            debug_output += user_text
-            debug_output += "\n" + "="*80 + "\n"
-            
-            # Log token count if possible
-            try:
-                token_counter = TokenCounter()
-                token_count = token_counter.count_tokens(user_text)
-                debug_output += f"Total tokens: {token_count}\n"
-                debug_output += "="*80 + "\n"
-            except Exception:
-                pass
-            
-            logging.debug(debug_output)
-
-        # Build API request
-        contents = [
-            {
-                "role": "user",
-                "parts": [
-                    {"text": user_text},
-                    {"inline_data": {"mime_type": "image/png", "data": img_base64}}
-                ]
-            }
-        ]
-        
-        gen_cfg_params = {
-            "temperature": config.temperature,
-            "max_output_tokens": config.max_output_tokens,
-            "response_mime_type": "application/json"
+        user_text += "\nOUTPUT FORMAT: Return a JSON object with fields: comment, mood_update, intensity\n"
+        if persona_context:
+            user_text += f"\n{persona_context}\n"
+        if history_display:
+            user_text += f"\n[WHAT YOU ALREADY SAID]:\n{history_display}\n"
+        if user_message:
+            user_text += f"\n[USER MESSAGE]: {user_message}\n"
+    
+    # Debug logging with token count. The exact BPE count is the only
+    # expensive part, so it is either replaced by the len/4 rule of
+    # thumb or pushed onto a background thread — either way the request
+    # path itself never tokenizes the prompt.
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        if getattr(config, 'fast_token_estimate', True):
+            _log_prompt_debug(user_text, len(user_text) // 4, approx=True)
+        else:
+            _get_debug_executor().submit(_count_and_log_prompt, user_text)
+
+    # Build API request
+    contents = [
+        {
+            "role": "user",
+            "parts": [
+                {"text": user_text},
+                {"inline_data": {"mime_type": SCREENSHOT_MIME_TYPE, "data": img_bytes}}
+            ]
         }
-        
-        # Call Gemini API
-        try:
-            response = model.generate_content(
-                contents,
-                generation_config=genai.types.GenerationConfig(**gen_cfg_params)
-            )
-            
-            # Parse JSON response
-            try:
-                result = json.loads(response.text)
-                comment = result.get("comment", "")
-                mood = result.get("mood_update", "neutral")
-                intensity = result.get("intensity", "low")
-                
-                # Update Persona State
-                if persona_manager:
-                    persona_manager.update_state(mood, intensity)
-                    persona_manager.record_interaction(comment, mood)
-                
-                # Add to history manager if provided
-                if history_manager:
-                    history_manager.add(
-                        comment=comment,
-                        mood=mood,
-                        intensity=intensity,
-                        user_message=user_message
-                    )
-                    
-                return comment
-            except json.JSONDecodeError:
-                # Fallback if JSON fails (rare with response_mime_type)
-                logging.warning(f"Failed to parse JSON response: {response.text}")
-                return response.text
-                
-        except Exception as e:
-            raise e
-            
-    except Exception as e:
-        raise e
+    ]
+    
+    generation_config = genai.types.GenerationConfig(
+        temperature=config.temperature,
+        max_output_tokens=config.max_output_tokens,
+        response_mime_type="application/json"
+    )
+    return contents, generation_config
+
+# Single background worker for exact debug token counts, created only
+# if a count is ever requested
+_DEBUG_EXECUTOR: Optional[Any] = None
+
+def _get_debug_executor() -> Any:
+    global _DEBUG_EXECUTOR
+    if _DEBUG_EXECUTOR is None:
+        from concurrent.futures import ThreadPoolExecutor
+        _DEBUG_EXECUTOR = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="debug-tokens")
+    return _DEBUG_EXECUTOR
+
+def _log_prompt_debug(user_text: str, token_count: Optional[int],
+                      approx: bool = False) -> None:
+    """Emits the full-prompt DEBUG banner with an optional token line."""
+    debug_output = "\n" + "="*80 + "\n"
+    debug_output += "FULL PROMPT SENT TO GEMINI API\n"
+    debug_output += "="*80 + "\n"
+    debug_output += user_text
+    debug_output += "\n" + "="*80 + "\n"
+    if token_count is not None:
+        label = "Approx tokens" if approx else "Total tokens"
+        debug_output += f"{label}: {token_count}\n"
+        debug_output += "="*80 + "\n"
+    logging.debug(debug_output)
+
+def _count_and_log_prompt(user_text: str) -> None:
+    """Exact token count plus debug banner, run off the request path."""
+    try:
+        from .token_counter import get_token_counter
+        token_count = get_token_counter().count_tokens(user_text)
+    except Exception:
+        token_count = None
+    _log_prompt_debug(user_text, token_count)
+
+def _parse_comment_text(text: str,
+                        user_message: Optional[str],
+                        persona_manager: Any,
+                        history_manager: Optional[Any]) -> Optional[str]:
+    """Parses a Gemini JSON response and applies persona/history updates."""
+    try:
+        result = json_loads(text)
+    except ValueError:
+        # Fallback if JSON fails (rare with response_mime_type)
+        logging.warning(f"Failed to parse JSON response: {text}")
+        return text
+
+    comment = result.get("comment", "")
+    mood = result.get("mood_update", "neutral")
+    intensity = result.get("intensity", "low")
+
+    # Update Persona State
+    if persona_manager:
+        persona_manager.update_state(mood, intensity)
+        persona_manager.record_interaction(comment, mood)
+
+    # Add to history manager if provided
+    if history_manager:
+        history_manager.add(
+            comment=comment,
+            mood=mood,
+            intensity=intensity,
+            user_message=user_message
+        )
+
+    return comment
+
+# One request-concurrency limiter per event loop; keyed by loop id so
+# the semaphore always belongs to the loop awaiting it.
+_ASYNC_LIMITS: Dict[int, "asyncio.Semaphore"] = {}
+
+def _get_async_semaphore(config: AppConfig) -> "asyncio.Semaphore":
+    loop = asyncio.get_running_loop()
+    sem = _ASYNC_LIMITS.get(id(loop))
+    if sem is None:
+        sem = asyncio.Semaphore(getattr(config, 'max_concurrent_requests', 2))
+        _ASYNC_LIMITS[id(loop)] = sem
+    return sem
+
+async def analyze_with_gemini_async(model: GenerativeModel,
+                                    screenshot: Any,
+                                    config: AppConfig,
+                                    style_prompt: Optional[str] = None,
+                                    history: Optional[List[Dict]] = None,
+                                    user_message: Optional[str] = None,
+                                    persona_manager: Any = None,
+                                    history_manager: Optional[Any] = None,
+                                    prompt_manager: Optional[Any] = None) -> Optional[str]:
+    """
+    Async variant of analyze_with_gemini.
+
+    The JPEG encode runs on a worker thread and the request goes through
+    the SDK's async client, so several analyses can be in flight while
+    the event loop stays free. Concurrency is capped per event loop by
+    config.max_concurrent_requests to respect the API quota.
+    """
+    if isinstance(screenshot, bytes):
+        img_bytes = screenshot
+    else:
+        img_bytes = await asyncio.to_thread(
+            encode_screenshot, screenshot,
+            quality=getattr(config, 'screenshot_jpeg_quality', 75),
+            max_edge=getattr(config, 'vision_max_edge', None)
+        )
+
+    contents, generation_config = _build_request(
+        img_bytes, config, style_prompt, history, user_message,
+        persona_manager, history_manager, prompt_manager
+    )
 
+    async with _get_async_semaphore(config):
+        response = await model.generate_content_async(
+            contents,
+            generation_config=generation_config
+        )
+    return _parse_comment_text(
+        response.text, user_message, persona_manager, history_manager)
@@ -1,7 +1,9 @@
-import json
+import time
 from dataclasses import dataclass, field, fields
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, ClassVar, Dict, List, Optional, Union
+
+from ._jsonfast import loads as json_loads, dumps_bytes as json_dumps_bytes
 
 @dataclass
 class AppConfig:
@@ -13,10 +15,13 @@ class AppConfig:
     screenshot_width: int = 1000
     screenshot_height: int = 1080
     screenshot_monitor_index: int = 1
+    screenshot_jpeg_quality: int = 75
+    vision_max_edge: int = 896
     
     # Hashing & Change Detection
     hash_method: str = "phash"
     hash_threshold: int = 7
+    phash_similarity_threshold: int = 3
     stable_window_seconds: int = 60
     only_on_change: bool = True
     
@@ -26,11 +31,13 @@ class AppConfig:
     minute_limit: int = 60
     day_limit: int = 10000
     alert_threshold_percent: int = 80
+    max_history_entries: int = 200
     
     # Retry Logic
     retry_max_attempts: int = 3
     retry_initial_delay: float = 1.0
     retry_backoff_factor: float = 2.0
+    retry_max_delay: float = 60.0
     disable_retries: bool = False
     
     # Response Formatting
@@ -46,6 +53,7 @@ class AppConfig:
     timeout_ms: int = 30000
     max_output_tokens: int = 1024
     response_modalities: List[str] = field(default_factory=lambda: ["text"])
+    max_concurrent_requests: int = 2
     context_history_size: int = 3
     
     # Paths & Logging
@@ -53,6 +61,8 @@ class AppConfig:
     log_path: str = "logs/ai_commentator.log"
     errors_dir: str = "logs/errors"
     log_every_n_calls: int = 5
+    # DEBUG prompt logging: len//4 estimate instead of an exact BPE count
+    fast_token_estimate: bool = True
     
     # UI Defaults
     menu_default_interval: int = 10
@@ -71,38 +81,88 @@ class AppConfig:
     use_anti_repetition: bool = True
     use_persona_context: bool = True
 
+    # Parsed configs keyed by path; entries are reused while the file's
+    # mtime is unchanged, so repeated load() calls cost one stat()
+    _CACHE: ClassVar[Dict[Path, tuple]] = {}
+
     @classmethod
     def load(cls, path: Path) -> "AppConfig":
-        """Loads configuration from a JSON file. Creates a default one if it doesn't exist."""
+        """Loads configuration from a JSON file. Creates a default one if it doesn't exist.
+
+        Results are cached per path and invalidated by file mtime, so
+        calling load() repeatedly does not re-read or re-parse an
+        unchanged file.
+        """
         if not path.exists():
             default_config = cls()
             default_config.save(path)
             return default_config
-        
+
         try:
-            with open(path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
+            mtime_ns = path.stat().st_mtime_ns
+            cached = cls._CACHE.get(path)
+            if cached is not None and cached[0] == mtime_ns:
+                return cached[1]
+
+            with open(path, 'rb') as f:
+                data = json_loads(f.read())
+
             # Filter out keys that are not in the dataclass
             valid_keys = {f.name for f in fields(cls)}
             filtered_data = {k: v for k, v in data.items() if k in valid_keys}
-            
+
             # Handle legacy keys or type conversions if necessary here
             # For now, we assume direct mapping is sufficient as per previous code
-            
-            return cls(**filtered_data)
+
+            config = cls(**filtered_data)
+            cls._CACHE[path] = (mtime_ns, config)
+            return config
         except Exception as e:
             print(f"Error loading config from {path}: {e}. Using defaults.")
             return cls()
 
+    @classmethod
+    def clear_cache(cls) -> None:
+        """Drops all cached parsed configs (mainly for tests)."""
+        cls._CACHE.clear()
+
     def save(self, path: Path) -> None:
         """Saves the current configuration to a JSON file."""
         try:
-            with open(path, 'w', encoding='utf-8') as f:
-                json.dump(self.__dict__, f, ensure_ascii=False, indent=4)
+            # Serialize declared fields only, so runtime bookkeeping
+            # attributes never leak into the config file
+            data = {f.name: getattr(self, f.name) for f in fields(self)}
+            with open(path, 'wb') as f:
+                f.write(json_dumps_bytes(data, indent=True))
+            self._dirty = False
+            self._last_flush = time.monotonic()
         except Exception as e:
             print(f"Error saving config to {path}: {e}")
 
+    def mark_dirty(self) -> None:
+        """Record that the config changed without writing it yet."""
+        self._dirty = True
+
+    def flush_if_dirty(self, path: Path, min_interval: float = 5.0) -> bool:
+        """
+        Write the config if it is dirty and the debounce interval passed.
+
+        Args:
+            path: Config file path.
+            min_interval: Minimum seconds between writes (0 = always).
+
+        Returns:
+            True if a write happened.
+        """
+        if not getattr(self, '_dirty', False):
+            return False
+        if min_interval > 0:
+            last = getattr(self, '_last_flush', 0.0)
+            if (time.monotonic() - last) < min_interval:
+                return False
+        self.save(path)
+        return True
+
     def get(self, key: str, default: Any = None) -> Any:
         """Legacy support for dict-like access."""
         return getattr(self, key, default)
@@ -1,20 +1,61 @@
 import time
 import imagehash
+import numpy as np
+from collections import OrderedDict
 from PIL import Image
-from typing import Optional, Dict, Any, Literal
+from typing import Optional, Dict, Any, Literal, Tuple
+
+from ._hash_kernels import dhash_bits
+
+# How many (hash, comment) pairs the similarity cache remembers
+SIMILAR_CACHE_SIZE = 16
+
+# Hashes are computed on a small thumbnail: perceptual hashes only use a
+# 32x32 (phash) or 9x8 (dhash) grid, so feeding them the full-resolution
+# frame just burns memory bandwidth on pixels that get thrown away.
+HASH_THUMB_SIZE = 64
+
+
+def hash_to_int(h: imagehash.ImageHash) -> int:
+    """Packs an ImageHash bit matrix into a Python int.
+
+    Hamming distance then becomes (a ^ b).bit_count(), which lowers to a
+    hardware POPCNT instead of a numpy array comparison per pair.
+    """
+    return int.from_bytes(np.packbits(h.hash.flatten()).tobytes(), 'big')
 
 class ChangeDetector:
     def __init__(self):
         self.last_hash: Optional[imagehash.ImageHash] = None
+        # Packed-int mirror of last_hash; distances are then a single
+        # XOR + POPCNT instead of a numpy boolean-array comparison
+        self._last_int: Optional[int] = None
         self.last_change_monotonic: Optional[float] = None
         self.last_change_ts: float = 0.0
         self.last_api_result: Optional[Any] = None
         self.cache_expire_monotonic: float = 0.0
-        
+        # LRU of recent screens: str(hash) -> (packed int hash, comment, expiry)
+        self.similar_cache: "OrderedDict[str, Tuple[int, Any, float]]" = OrderedDict()
+        # One-slot cache of the last encoded frame, keyed by its hash
+        self.encoded_hash: Optional[imagehash.ImageHash] = None
+        self.encoded_bytes: Optional[bytes] = None
+
     def compute_hash(self, img: Image.Image, method: str = "phash") -> Optional[imagehash.ImageHash]:
         """Computes the hash of an image using the specified method."""
         try:
+            # Cheap box-filter downscale first; the hash's own resize then
+            # works on ~4 KB instead of the full frame
+            if img.width > HASH_THUMB_SIZE or img.height > HASH_THUMB_SIZE:
+                img = img.resize((HASH_THUMB_SIZE, HASH_THUMB_SIZE), Image.Resampling.BILINEAR)
             if method.lower() == "dhash":
+                if dhash_bits is not None:
+                    # JIT-compiled gradient kernel (numba); same bit
+                    # layout as imagehash.dhash
+                    gray = np.asarray(
+                        img.convert("L").resize((9, 8), Image.Resampling.LANCZOS),
+                        dtype=np.uint8
+                    )
+                    return imagehash.ImageHash(dhash_bits(gray))
                 return imagehash.dhash(img)
             return imagehash.phash(img)
         except Exception as e:
@@ -35,19 +76,35 @@ class ChangeDetector:
         now_m = time.monotonic()
         now_wall = time.time()
         
+        curr_int = hash_to_int(curr_hash)
+
         if self.last_hash is None:
             self.last_hash = curr_hash
+            self._last_int = curr_int
             self.last_change_monotonic = now_m
             self.last_change_ts = now_wall
             return "call"
-            
-        dist = self.last_hash - curr_hash
+
+        if self._last_int is None:
+            # last_hash was assigned directly; pack it on first use
+            self._last_int = hash_to_int(self.last_hash)
+
+        dist = (self._last_int ^ curr_int).bit_count()
         if dist >= threshold:
             self.last_hash = curr_hash
+            self._last_int = curr_int
             self.last_change_monotonic = now_m
             self.last_change_ts = now_wall
+            # Semantic cache: a visually similar screen may already have a
+            # comment — reuse it instead of paying for a Gemini round-trip
+            similar = self._find_similar(curr_int, config, now_m)
+            if similar is not None:
+                comment, expiry = similar
+                self.last_api_result = comment
+                self.cache_expire_monotonic = expiry
+                return "use_cache"
             return "call"
-            
+
         # Changes below threshold
         if self.last_api_result and now_m < self.cache_expire_monotonic:
             return "use_cache"
@@ -61,11 +118,66 @@ class ChangeDetector:
         # If only_on_change is False, we generate even if no change (after cache check)
         return "call"
 
+    def _find_similar(self, curr_int: int,
+                      config: Any, now_m: float) -> Optional[Tuple[Any, float]]:
+        """Returns (comment, expiry) of the nearest cached screen within
+        the similarity threshold, or None. Expired entries are evicted."""
+        threshold = getattr(config, 'phash_similarity_threshold', 0)
+        if threshold <= 0 or config.disable_cache or not self.similar_cache:
+            return None
+
+        best: Optional[Tuple[Any, float]] = None
+        best_key: Optional[str] = None
+        best_dist = threshold + 1
+        for key in list(self.similar_cache):
+            cached_int, comment, expiry = self.similar_cache[key]
+            if now_m >= expiry:
+                del self.similar_cache[key]
+                continue
+            d = (cached_int ^ curr_int).bit_count()
+            if d <= threshold and d < best_dist:
+                best = (comment, expiry)
+                best_key = key
+                best_dist = d
+
+        if best_key is not None:
+            self.similar_cache.move_to_end(best_key)
+        return best
+
+    def get_or_encode(self, curr_hash: Optional[imagehash.ImageHash],
+                      encode: Any) -> bytes:
+        """Returns encoded image bytes, reusing the previous encode when
+        the frame hash is identical.
+
+        A "call" decision can repeat for a visually unchanged screen
+        (e.g. after the comment cache expires); skipping the re-encode
+        there saves a full JPEG pass over the frame.
+
+        Args:
+            curr_hash: Hash of the frame about to be encoded.
+            encode: Zero-argument callable producing the encoded bytes.
+        """
+        if (self.encoded_bytes is not None and curr_hash is not None
+                and self.encoded_hash == curr_hash):
+            return self.encoded_bytes
+        data = encode()
+        self.encoded_hash = curr_hash
+        self.encoded_bytes = data
+        return data
+
     def cache_set(self, result: Any, ttl: int, disable_cache: bool) -> None:
         if disable_cache:
             return
         self.last_api_result = result
         self.cache_expire_monotonic = time.monotonic() + ttl
+        # Remember this screen's comment for near-match reuse
+        if self.last_hash is not None:
+            key = str(self.last_hash)
+            packed = self._last_int if self._last_int is not None else hash_to_int(self.last_hash)
+            self.similar_cache[key] = (packed, result, self.cache_expire_monotonic)
+            self.similar_cache.move_to_end(key)
+            while len(self.similar_cache) > SIMILAR_CACHE_SIZE:
+                self.similar_cache.popitem(last=False)
 
     def cache_get(self, disable_cache: bool) -> Any:
         if disable_cache:
@@ -1,17 +1,21 @@
 """
 Advanced history management with token counting and intelligent trimming.
 """
-from typing import List, Dict, Optional
+from typing import Deque, List, Dict, Optional
 from pathlib import Path
-import json
+from collections import Counter, deque
+import atexit
 import logging
+import time
 from dataclasses import dataclass, asdict
 from datetime import datetime
 
 try:
-    from .token_counter import TokenCounter
+    from .token_counter import get_token_counter
+    from ._jsonfast import loads as json_loads, dumps_bytes as json_dumps_bytes
 except ImportError:
-    from token_counter import TokenCounter
+    from token_counter import get_token_counter
+    from _jsonfast import loads as json_loads, dumps_bytes as json_dumps_bytes
 
 
 @dataclass
@@ -42,6 +46,11 @@ class HistoryEntry:
         )
 
 
+# Auto-saves triggered by add() are debounced to at most one full
+# rewrite per this many seconds
+SAVE_DEBOUNCE_SECONDS = 5.0
+
+
 class HistoryManager:
     """
     Advanced history management with token counting and intelligent trimming.
@@ -74,12 +83,23 @@ class HistoryManager:
         self.max_entries = max_entries
         self.enable_token_counting = enable_token_counting
         
-        # Initialize token counter
-        self.token_counter = TokenCounter() if enable_token_counting else None
-        
-        # Storage
-        self.entries: List[HistoryEntry] = []
+        # Initialize token counter (shared instance; the BPE table is
+        # loaded once per process)
+        self.token_counter = get_token_counter() if enable_token_counting else None
         
+        # Storage; maxlen keeps memory bounded so save() never slices
+        self.entries: Deque[HistoryEntry] = deque(maxlen=max_entries)
+        # Running tallies so get_summary never re-walks the whole list
+        self._total_tokens: int = 0
+        self._chat_count: int = 0
+        self._mood_counts: Counter = Counter()
+
+        # Debounced-save bookkeeping; flush() runs at exit so debounced
+        # entries aren't lost
+        self._dirty: bool = False
+        self._last_save: float = 0.0
+        atexit.register(self.flush)
+
         # Load existing history
         self._load()
     
@@ -90,28 +110,37 @@ class HistoryManager:
             return
         
         try:
-            with open(self.history_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            with open(self.history_file, 'rb') as f:
+                data = json_loads(f.read())
             
             # Handle both old format (dict with timestamp/comment) and new format
-            self.entries = []
+            loaded = []
             for entry in data:
                 if isinstance(entry, dict):
                     # Try to create HistoryEntry, fallback to basic format
                     try:
-                        self.entries.append(HistoryEntry.from_dict(entry))
+                        loaded.append(HistoryEntry.from_dict(entry))
                     except Exception as e:
                         # Old format compatibility
-                        self.entries.append(HistoryEntry(
+                        loaded.append(HistoryEntry(
                             timestamp=entry.get('timestamp', ''),
                             comment=entry.get('comment', '')
                         ))
-            
+
+            # Tallies below must describe what survived the maxlen cap
+            self.entries = deque(loaded, maxlen=self.max_entries)
+
+            self._total_tokens = sum(e.token_count for e in self.entries)
+            self._chat_count = sum(1 for e in self.entries if e.user_message)
+            self._mood_counts = Counter(e.mood for e in self.entries if e.mood)
             logging.info(f"Loaded {len(self.entries)} history entries")
-            
+
         except Exception as e:
             logging.error(f"Failed to load history: {e}")
-            self.entries = []
+            self.entries = deque(maxlen=self.max_entries)
+            self._total_tokens = 0
+            self._chat_count = 0
+            self._mood_counts = Counter()
     
     def save(self):
         """Save history to file."""
@@ -119,21 +148,24 @@ class HistoryManager:
             # Ensure parent directory exists
             self.history_file.parent.mkdir(parents=True, exist_ok=True)
             
-            # Limit to max entries
-            entries_to_save = self.entries[-self.max_entries:]
-            
-            with open(self.history_file, 'w', encoding='utf-8') as f:
-                json.dump(
-                    [e.to_dict() for e in entries_to_save],
-                    f,
-                    ensure_ascii=False,
-                    indent=2
-                )
-            
+            # Already capped at max_entries by the deque
+            entries_to_save = self.entries
+
+            with open(self.history_file, 'wb') as f:
+                f.write(json_dumps_bytes(
+                    [e.to_dict() for e in entries_to_save], indent=True))
+
+            self._dirty = False
+            self._last_save = time.monotonic()
             logging.debug(f"Saved {len(entries_to_save)} history entries")
-            
+
         except Exception as e:
             logging.error(f"Failed to save history: {e}")
+
+    def flush(self):
+        """Write pending entries to disk, if any."""
+        if self._dirty:
+            self.save()
     
     def add(
         self, 
@@ -168,12 +200,32 @@ class HistoryManager:
             token_count=token_count
         )
         
+        # Appending at maxlen evicts the oldest entry; keep the running
+        # tallies in step with what actually remains
+        if self.entries.maxlen and len(self.entries) == self.entries.maxlen:
+            evicted = self.entries[0]
+            self._total_tokens -= evicted.token_count
+            if evicted.user_message:
+                self._chat_count -= 1
+            if evicted.mood:
+                self._mood_counts[evicted.mood] -= 1
+                if self._mood_counts[evicted.mood] <= 0:
+                    del self._mood_counts[evicted.mood]
+
         self.entries.append(entry)
-        
+        self._total_tokens += token_count
+        if user_message:
+            self._chat_count += 1
+        if mood:
+            self._mood_counts[mood] += 1
+
         logging.debug(f"Added history entry ({token_count} tokens)")
-        
-        # Auto-save
-        self.save()
+
+        # Auto-save, debounced: every add rewriting the full JSON list
+        # put O(len(entries)) disk IO on the post-API hot path
+        self._dirty = True
+        if time.monotonic() - self._last_save >= SAVE_DEBOUNCE_SECONDS:
+            self.save()
     
     def get_recent(
         self, 
@@ -193,24 +245,28 @@ class HistoryManager:
         if max_tokens is None:
             max_tokens = self.max_tokens
         
-        # Get recent entries
-        recent = self.entries[-count:] if count > 0 else self.entries
-        
+        # Get recent entries (list() because deques don't slice)
+        entries = list(self.entries)
+        recent = entries[-count:] if count > 0 else entries
+
         if not recent:
             return []
-        
-        # Convert to dicts
-        recent_dicts = [e.to_dict() for e in recent]
-        
-        # Trim to token limit if token counter available
+
+        # Trim to token limit using the token_count memoized at add()
+        # time — a cumulative walk from the tail, no re-encoding
         if self.token_counter and max_tokens:
-            recent_dicts = self.token_counter.trim_to_token_limit(
-                recent_dicts,
-                max_tokens,
-                keep_latest=min(3, len(recent_dicts))
-            )
-        
-        return recent_dicts
+            keep_latest = min(3, len(recent))
+            kept = list(recent[-keep_latest:])
+            running = sum(e.token_count for e in kept)
+            if running < max_tokens:
+                for entry in reversed(recent[:-keep_latest]):
+                    if running + entry.token_count > max_tokens:
+                        break
+                    kept.insert(0, entry)
+                    running += entry.token_count
+            recent = kept
+
+        return [e.to_dict() for e in recent]
     
     def get_context_for_prompt(
         self, 
@@ -251,7 +307,10 @@ class HistoryManager:
     
     def clear(self):
         """Clear all history."""
-        self.entries = []
+        self.entries = deque(maxlen=self.max_entries)
+        self._total_tokens = 0
+        self._chat_count = 0
+        self._mood_counts = Counter()
         self.save()
         logging.info("History cleared")
     
@@ -270,17 +329,10 @@ class HistoryManager:
                 "latest_timestamp": None
             }
         
-        total_tokens = sum(e.token_count for e in self.entries)
-        
-        # Count entries with user messages (chat interactions)
-        chat_interactions = sum(1 for e in self.entries if e.user_message)
-        
-        # Mood distribution
-        moods = {}
-        for e in self.entries:
-            if e.mood:
-                moods[e.mood] = moods.get(e.mood, 0) + 1
-        
+        total_tokens = self._total_tokens
+        chat_interactions = self._chat_count
+        moods = dict(self._mood_counts)
+
         return {
             "total_entries": len(self.entries),
             "total_tokens": total_tokens,
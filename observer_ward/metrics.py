@@ -1,15 +1,148 @@
 import time
 import logging
-from collections import deque
-from datetime import datetime
-from typing import Deque, Dict, List, Optional, Tuple
+from typing import List, Tuple
+
+import numpy as np
+
+from ._metric_kernels import three_kth
+
+logger = logging.getLogger(__name__)
+
+# Only every Nth api_call line is emitted; the counters themselves are
+# always exact
+_LOG_EVERY_N = 5
+
+class LatencyRing:
+    """Last-N samples in one contiguous float64 block.
+
+    A deque(maxlen=N) stores floats boxed across linked 64-element
+    blocks, and reading it back means list(deque) plus a full sort.
+    Writing into a preallocated ndarray keeps the window cache-friendly
+    and lets percentile queries use np.partition — O(n) selection over
+    contiguous memory, no Python-level iteration.
+    """
+    def __init__(self, size: int = 500):
+        self._buf = np.empty(size, np.float64)
+        self._pos = 0
+        self._n = 0
+
+    def add(self, x: float) -> None:
+        buf = self._buf
+        buf[self._pos] = x
+        self._pos = (self._pos + 1) % buf.shape[0]
+        if self._n < buf.shape[0]:
+            self._n += 1
+
+    def __len__(self) -> int:
+        return self._n
+
+    def percentiles(self, *ps: float) -> Tuple[float, ...]:
+        """Selects the given quantiles (fractions in [0, 1]) at once."""
+        n = self._n
+        if n == 0:
+            return tuple(0.0 for _ in ps)
+        ks = [min(n - 1, max(0, int(round(p * (n - 1))))) for p in ps]
+        if three_kth is not None and len(ks) == 3:
+            # JIT-compiled selection kernel (numba)
+            return tuple(float(v) for v in
+                         three_kth(self._buf[:n], ks[0], ks[1], ks[2]))
+        part = np.partition(self._buf[:n], ks)
+        return tuple(float(part[k]) for k in ks)
+
+class P2Quantile:
+    """Streaming quantile estimator (Jain & Chlamtac's P-squared).
+
+    Tracks one quantile with five markers updated in constant time per
+    observation, so reading the estimate never sorts or copies the
+    sample history. Accurate to well under a percentile point for the
+    smooth, unimodal latency distributions seen here.
+    """
+    def __init__(self, p: float):
+        self.p = p
+        self.count = 0
+        # Marker heights; filled with the first five raw observations
+        self._q: List[float] = []
+        # Actual and desired marker positions
+        self._pos = [1.0, 2.0, 3.0, 4.0, 5.0]
+        self._desired = [1.0, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5.0]
+        self._incr = [0.0, p / 2, p, (1 + p) / 2, 1.0]
+
+    def add(self, x: float) -> None:
+        """Feeds one observation; O(1), no allocation after warm-up."""
+        self.count += 1
+        q = self._q
+        if self.count <= 5:
+            q.append(x)
+            if self.count == 5:
+                q.sort()
+            return
+
+        # Locate the cell containing x, clamping the extremes
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while k < 3 and x >= q[k + 1]:
+                k += 1
+
+        pos = self._pos
+        for i in range(k + 1, 5):
+            pos[i] += 1
+        for i in range(5):
+            self._desired[i] += self._incr[i]
+
+        # Nudge the three interior markers toward their desired positions
+        for i in (1, 2, 3):
+            d = self._desired[i] - pos[i]
+            if ((d >= 1 and pos[i + 1] - pos[i] > 1)
+                    or (d <= -1 and pos[i - 1] - pos[i] < -1)):
+                d = 1.0 if d > 0 else -1.0
+                candidate = self._parabolic(i, d)
+                if q[i - 1] < candidate < q[i + 1]:
+                    q[i] = candidate
+                else:
+                    # Parabolic step left the bracket; fall back to linear
+                    j = i + int(d)
+                    q[i] += d * (q[j] - q[i]) / (pos[j] - pos[i])
+                pos[i] += d
+
+    def _parabolic(self, i: int, d: float) -> float:
+        q, pos = self._q, self._pos
+        return q[i] + d / (pos[i + 1] - pos[i - 1]) * (
+            (pos[i] - pos[i - 1] + d) * (q[i + 1] - q[i]) / (pos[i + 1] - pos[i])
+            + (pos[i + 1] - pos[i] - d) * (q[i] - q[i - 1]) / (pos[i] - pos[i - 1])
+        )
+
+    def value(self) -> float:
+        """Current estimate; exact while fewer than five samples exist."""
+        if self.count == 0:
+            return 0.0
+        if self.count < 5:
+            s = sorted(self._q)
+            idx = min(len(s) - 1, max(0, int(round(self.p * (len(s) - 1)))))
+            return s[idx]
+        return self._q[2]
+
+# Quantiles reported in the stats line
+_STAT_QUANTILES = (0.50, 0.90, 0.99)
 
 class MetricsManager:
     def __init__(self):
-        self.calls_minute: Deque[float] = deque()
+        # Rolling one-minute call count: 60 per-second buckets and a
+        # running sum, advanced lazily. O(1) per call, no per-event
+        # storage or popleft churn.
+        self._minute_buckets = np.zeros(60, np.int32)
+        self._minute_sum: int = 0
+        self._last_sec: int = int(time.monotonic())
         self.calls_day: int = 0
         self.tokens_day: int = 0
-        self.day_ymd: Optional[str] = None
+        # Local epoch-day; an int compare per call instead of building
+        # and formatting a datetime
+        self._day_epoch: int = -1
         
         # Latency metrics
         self.latency_vision_total: float = 0.0
@@ -17,68 +150,101 @@ class MetricsManager:
         self.latency_text_total: float = 0.0
         self.latency_text_count: int = 0
         
-        self.latency_vision_samples: Deque[float] = deque(maxlen=500)
-        self.latency_text_samples: Deque[float] = deque(maxlen=500)
+        # Online quantile estimators; updated per sample so the stats
+        # line never sorts a sample buffer
+        self._lat_v_quantiles = tuple(P2Quantile(p) for p in _STAT_QUANTILES)
+        self._lat_t_quantiles = tuple(P2Quantile(p) for p in _STAT_QUANTILES)
         
         # Request latency (including retries)
         self.req_latency_vision_total: float = 0.0
         self.req_latency_vision_count: int = 0
-        self.req_latency_vision_samples: Deque[float] = deque(maxlen=500)
-        
+        self.req_latency_vision_samples = LatencyRing(500)
+
         self.req_latency_text_total: float = 0.0
         self.req_latency_text_count: int = 0
-        self.req_latency_text_samples: Deque[float] = deque(maxlen=500)
+        self.req_latency_text_samples = LatencyRing(500)
         
         self.silent_skip_count: int = 0
+        self.dropped_frame_count: int = 0
         self.log_counter: int = 0
 
     def _roll_day(self) -> None:
-        today = datetime.now().date().isoformat()
-        if self.day_ymd != today:
-            self.day_ymd = today
+        # Epoch-day compare (UTC boundary); building a datetime and an
+        # ISO string per call was pure overhead for a quota reset check
+        day = int(time.time() // 86400)
+        if day != self._day_epoch:
+            self._day_epoch = day
             self.calls_day = 0
             self.tokens_day = 0
 
+    def _advance_minute(self) -> None:
+        """Zeroes the buckets for seconds that elapsed since last use."""
+        sec = int(time.monotonic())
+        elapsed = sec - self._last_sec
+        if elapsed <= 0:
+            return
+        if elapsed >= 60:
+            self._minute_buckets[:] = 0
+            self._minute_sum = 0
+        else:
+            for s in range(self._last_sec + 1, sec + 1):
+                idx = s % 60
+                self._minute_sum -= int(self._minute_buckets[idx])
+                self._minute_buckets[idx] = 0
+        self._last_sec = sec
+
     def record_api_call(self, tokens: int = 0) -> None:
         self._roll_day()
-        now = time.monotonic()
-        self.calls_minute.append(now)
-        
-        # Clean up calls older than 60 seconds
-        while self.calls_minute and (now - self.calls_minute[0]) > 60:
-            self.calls_minute.popleft()
-            
+        self._advance_minute()
+        self._minute_buckets[self._last_sec % 60] += 1
+        self._minute_sum += 1
+
         self.calls_day += 1
         self.tokens_day += int(tokens)
-        logging.info(f"api_call minute={len(self.calls_minute)} day={self.calls_day} tokens_day={self.tokens_day}")
+        self.log_counter += 1
+        # Deferred %-formatting plus 1-in-N sampling: nothing is built
+        # when INFO is off, and chatty runs don't flood the log
+        if self.log_counter % _LOG_EVERY_N == 0 and logger.isEnabledFor(logging.INFO):
+            logger.info("api_call minute=%d day=%d tokens_day=%d",
+                        self._minute_sum, self.calls_day, self.tokens_day)
 
     def record_latency(self, kind: str, latency: float) -> None:
         if kind == "vision":
             self.latency_vision_total += latency
             self.latency_vision_count += 1
-            self.latency_vision_samples.append(latency)
-            logging.info(f"Latency (vision): {latency:.3f}s")
+            for q in self._lat_v_quantiles:
+                q.add(latency)
+            logger.info("Latency (vision): %.3fs", latency)
         elif kind == "text":
             self.latency_text_total += latency
             self.latency_text_count += 1
-            self.latency_text_samples.append(latency)
-            logging.info(f"Latency (text): {latency:.3f}s")
+            for q in self._lat_t_quantiles:
+                q.add(latency)
+            logger.info("Latency (text): %.3fs", latency)
 
     def record_request_latency(self, kind: str, latency: float) -> None:
         if kind == "vision":
             self.req_latency_vision_total += latency
             self.req_latency_vision_count += 1
-            self.req_latency_vision_samples.append(latency)
+            self.req_latency_vision_samples.add(latency)
         elif kind == "text":
             self.req_latency_text_total += latency
             self.req_latency_text_count += 1
-            self.req_latency_text_samples.append(latency)
+            self.req_latency_text_samples.add(latency)
+
+    def request_latency_percentiles(self, kind: str) -> Tuple[float, float, float]:
+        """p50/p90/p99 over the recent full-request latency window."""
+        ring = (self.req_latency_vision_samples if kind == "vision"
+                else self.req_latency_text_samples)
+        return ring.percentiles(0.50, 0.90, 0.99)
+
+    def record_dropped_frame(self) -> None:
+        """Counts frames discarded because the analysis side fell behind."""
+        self.dropped_frame_count += 1
 
     def calls_per_minute(self) -> int:
-        now = time.monotonic()
-        while self.calls_minute and (now - self.calls_minute[0]) > 60:
-            self.calls_minute.popleft()
-        return len(self.calls_minute)
+        self._advance_minute()
+        return self._minute_sum
 
     def get_stats_string(self, day_limit: int) -> str:
         pm = self.calls_per_minute()
@@ -88,11 +254,11 @@ class MetricsManager:
         lat_v_avg = self.latency_vision_total / self.latency_vision_count if self.latency_vision_count > 0 else 0.0
         lat_t_avg = self.latency_text_total / self.latency_text_count if self.latency_text_count > 0 else 0.0
         
-        v_p50, v_p90, v_p99 = self._percentiles(list(self.latency_vision_samples))
-        t_p50, t_p90, t_p99 = self._percentiles(list(self.latency_text_samples))
+        v_p50, v_p90, v_p99 = (q.value() for q in self._lat_v_quantiles)
+        t_p50, t_p90, t_p99 = (q.value() for q in self._lat_t_quantiles)
         
         stats_parts = [
-            f"API: {pm}/мин | {pd}/{day_limit} дн | Токены: {tokens} | Skips: {self.silent_skip_count}",
+            f"API: {pm}/мин | {pd}/{day_limit} дн | Токены: {tokens} | Skips: {self.silent_skip_count} | Dropped: {self.dropped_frame_count}",
             f"Vision: {lat_v_avg:.3f}s (p50={v_p50:.3f}, p90={v_p90:.3f}, p99={v_p99:.3f})"
         ]
         
@@ -101,15 +267,5 @@ class MetricsManager:
             
         return " | ".join(stats_parts)
 
-    def _percentiles(self, samples: List[float]) -> Tuple[float, float, float]:
-        if not samples:
-            return (0.0, 0.0, 0.0)
-        s = sorted(samples)
-        n = len(s)
-        def _p(p: float) -> float:
-            idx = min(n - 1, max(0, int(round((p / 100.0) * (n - 1)))))
-            return s[idx]
-        return (_p(50), _p(90), _p(99))
-
 # Global instance
 METRICS = MetricsManager()
@@ -1,10 +1,35 @@
-import json
+import atexit
 import logging
+import os
+import queue
+import threading
 import time
 from pathlib import Path
 from typing import Dict, Any, Optional, List
 from datetime import datetime
 
+from collections import deque
+
+from ._jsonfast import loads as json_loads, dumps_bytes as json_dumps_bytes
+
+# Long-term memory keeps this many most-recent sessions
+MAX_SESSIONS = 10
+
+# record_interaction saves at most once per this many seconds; the rest
+# just mark the memory dirty
+SAVE_DEBOUNCE_SECONDS = 5.0
+
+# Second-granularity timestamp string, reformatted only when the clock
+# ticks over — events within the same second share one strftime call
+_ts_cache = (0, "")
+
+def _cached_timestamp() -> str:
+    global _ts_cache
+    now = int(time.time())
+    if now != _ts_cache[0]:
+        _ts_cache = (now, time.strftime("%Y-%m-%dT%H:%M:%S"))
+    return _ts_cache[1]
+
 class PersonaManager:
     """
     Manages the AI's internal state (mood, memory) to make it feel alive.
@@ -22,26 +47,81 @@ class PersonaManager:
         # Load long-term memory
         self.memory = self._load_memory()
         
-        # Session tracking
+        # Session tracking; durations come from the monotonic clock so
+        # reading them never constructs a datetime
         self.session_start = datetime.now()
+        self._session_start_mono = time.monotonic()
         self.session_events = []
 
+        # Debounced-save bookkeeping; flush() runs at exit so debounced
+        # interactions aren't lost
+        self._dirty = False
+        self._last_save = 0.0
+        self._save_lock = threading.Lock()
+        atexit.register(self.flush)
+
+        # Disk writes happen on a background daemon thread fed by this
+        # queue, so record_interaction never blocks on I/O
+        self._save_q: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._writer = threading.Thread(target=self._writer_loop, daemon=True)
+        self._writer.start()
+
     def _load_memory(self) -> Dict[str, Any]:
+        memory = {"sessions": [], "total_comments": 0}
         if self.memory_file.exists():
             try:
-                with open(self.memory_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                with open(self.memory_file, 'rb') as f:
+                    memory = json_loads(f.read())
             except Exception as e:
                 logging.error(f"Failed to load memory: {e}")
-        return {"sessions": [], "total_comments": 0}
+        # maxlen makes the keep-last-10 trim O(1) with no reallocation
+        memory["sessions"] = deque(memory.get("sessions", []), maxlen=MAX_SESSIONS)
+        return memory
 
     def _save_memory(self):
+        # Serialized via the orjson-backed shim straight to UTF-8 bytes;
+        # the tmp-file + os.replace dance keeps the file whole if the
+        # process dies mid-write
+        tmp_path = self.memory_file.with_suffix('.json.tmp')
         try:
-            with open(self.memory_file, 'w', encoding='utf-8') as f:
-                json.dump(self.memory, f, ensure_ascii=False, indent=4)
+            with self._save_lock:
+                with open(tmp_path, 'wb') as f:
+                    f.write(json_dumps_bytes(
+                        {**self.memory, "sessions": list(self.memory["sessions"])}))
+                os.replace(tmp_path, self.memory_file)
+            self._dirty = False
+            self._last_save = time.monotonic()
         except Exception as e:
             logging.error(f"Failed to save memory: {e}")
 
+    def flush(self):
+        """Write pending memory changes to disk, if any."""
+        if self._dirty:
+            self._save_memory()
+
+    def _writer_loop(self):
+        """Consumes save signals and writes at most one file per batch.
+
+        Signals queued while a write (or the debounce pause) is in
+        progress coalesce into the next write, so a burst of comments
+        costs one rewrite. A None sentinel flushes and exits.
+        """
+        while True:
+            item = self._save_q.get()
+            # Coalesce everything already queued into this write
+            try:
+                while True:
+                    if self._save_q.get_nowait() is None:
+                        item = None
+            except queue.Empty:
+                pass
+            if self._dirty:
+                self._save_memory()
+            if item is None:
+                return
+            # Pace writes; signals arriving during the pause batch up
+            time.sleep(SAVE_DEBOUNCE_SECONDS)
+
     def update_state(self, mood_update: str, intensity: str):
         """Updates the internal emotional state based on AI feedback."""
         if mood_update:
@@ -55,8 +135,7 @@ class PersonaManager:
         state_str = f"CURRENT EMOTIONAL STATE: {self.current_mood.upper()} (Intensity: {self.intensity.upper()})"
         
         # 2. Session Context
-        duration = datetime.now() - self.session_start
-        minutes = int(duration.total_seconds() / 60)
+        minutes = int((time.monotonic() - self._session_start_mono) / 60)
         time_context = f"Session Duration: {minutes} minutes."
         
         # 3. Long-term Memory (Greeting/Recall)
@@ -71,24 +150,31 @@ class PersonaManager:
     def record_interaction(self, comment: str, mood: str):
         """Records an interaction for the current session."""
         self.session_events.append({
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": _cached_timestamp(),
             "comment": comment,
             "mood": mood
         })
         
-        # Update long-term stats
+        # Update long-term stats; the actual write happens on the
+        # background writer, so this is a nearly-free enqueue
         self.memory["total_comments"] = self.memory.get("total_comments", 0) + 1
-        self._save_memory()
+        self._dirty = True
+        self._save_q.put(True)
 
     def end_session(self):
         """Summarizes and saves the session to long-term memory."""
         session_summary = {
             "date": datetime.now().strftime("%Y-%m-%d %H:%M"),
-            "duration_minutes": int((datetime.now() - self.session_start).total_seconds() / 60),
+            "duration_minutes": int((time.monotonic() - self._session_start_mono) / 60),
             "comment_count": len(self.session_events),
             "final_mood": self.current_mood
         }
+        # deque(maxlen) evicts the oldest session on append
         self.memory["sessions"].append(session_summary)
-        # Keep only last 10 sessions
-        self.memory["sessions"] = self.memory["sessions"][-10:]
-        self._save_memory()
+        self._dirty = True
+        if self._writer.is_alive():
+            # Hand the final write to the writer and wait it out
+            self._save_q.put(None)
+            self._writer.join(timeout=5.0)
+        if self._dirty:
+            self._save_memory()
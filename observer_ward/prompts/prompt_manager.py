@@ -1,42 +1,108 @@
 """
 Prompt management with templates and versioning.
 """
-from typing import Dict, Optional, List
+from typing import Callable, Dict, FrozenSet, Optional, List, Tuple
+from collections import OrderedDict
 from pathlib import Path
 import json
 import logging
+import string
 from dataclasses import dataclass, asdict
 
 
+def _compile_section(text: str) -> Tuple[Optional[Callable[[Dict[str, str]], str]], FrozenSet[str]]:
+    """Parses one section's format string ahead of time.
+
+    Returns (renderer, field_names). The renderer substitutes variables
+    from the parse tree without re-tokenizing the string each call, and
+    missing variables render as empty instead of raising KeyError. For
+    placeholder-free sections the renderer is None — the raw text can be
+    used as-is with no per-call work at all.
+    """
+    pieces = [(literal, name) for literal, name, _, _
+              in string.Formatter().parse(text)]
+    fields = frozenset(name for _, name in pieces if name)
+    if not fields:
+        return None, fields
+
+    def render(variables: Dict[str, str]) -> str:
+        out = []
+        for literal, name in pieces:
+            if literal:
+                out.append(literal)
+            if name is not None:
+                out.append(str(variables.get(name, "")))
+        return "".join(out)
+
+    return render, fields
+
+
+# Canonical section order for assembled prompts. Static sections come
+# first so Gemini sees a stable prefix for provider-side prompt
+# caching; volatile content (mood context, history, user message) last.
+_CANONICAL_ORDER = ('persona', 'task', 'anti_repetition', 'output_format',
+                    'context', 'history', 'user_message')
+
+# Variable that must be non-empty for a section to be included; absent
+# keys are unconditional
+_SECTION_GATES = {
+    'persona': 'persona_instruction',
+    'context': 'persona_context',
+    'history': 'history_display',
+    'user_message': 'user_message',
+}
+
+
 @dataclass
 class PromptTemplate:
     """Template for building prompts with multiple sections."""
-    
+
     name: str
     sections: Dict[str, str]  # section_name -> template_text
     version: str = "1.0"
     description: str = ""
-    
+
+    def __post_init__(self):
+        # section_name -> (renderer or None for static text, field
+        # names); built once so render paths never re-parse. A plain
+        # attribute, not a dataclass field, so asdict() stays clean.
+        self._compiled = {
+            name: _compile_section(text) for name, text in self.sections.items()
+        }
+        # Resolved (name, renderer, gate) tuples in canonical order, so
+        # assembly is one walk over a list — no per-call dict building
+        # or repeated section lookups. Sections outside the canonical
+        # set keep their template order at the end.
+        order = [n for n in _CANONICAL_ORDER if n in self.sections]
+        order += [n for n in self.sections if n not in _CANONICAL_ORDER]
+        self._section_order = [
+            (name, self._compiled[name][0], _SECTION_GATES.get(name))
+            for name in order
+        ]
+
+    def render_section(self, section_name: str, variables: Dict[str, str]) -> str:
+        """Render one section using its precompiled parse tree."""
+        renderer, _ = self._compiled[section_name]
+        if renderer is None:
+            return self.sections[section_name]
+        return renderer(variables)
+
     def render(self, **variables) -> str:
         """
         Render template with variables.
-        
+
         Args:
             **variables: Variables to substitute in template
-            
+
         Returns:
             Rendered prompt string
         """
         result = []
-        for section_name, template in self.sections.items():
-            try:
-                rendered = template.format(**variables)
-                if rendered.strip():
-                    result.append(rendered)
-            except KeyError as e:
-                logging.warning(f"Missing variable in template {self.name}, section {section_name}: {e}")
-                result.append(template)  # Use unrendered template as fallback
-        
+        for section_name in self.sections:
+            rendered = self.render_section(section_name, variables)
+            if rendered.strip():
+                result.append(rendered)
+
         return "\n\n".join(result)
     
     def to_dict(self) -> dict:
@@ -73,6 +139,9 @@ class PromptManager:
             self.prompts_dir = Path(__file__).parent
         
         self.templates: Dict[str, PromptTemplate] = {}
+        # LRU of rendered prompts; ticks with unchanged persona/history
+        # reuse the assembled string instead of re-rendering sections
+        self._render_cache: "OrderedDict[tuple, str]" = OrderedDict()
         self._load_default_templates()
     
     def _load_default_templates(self):
@@ -153,31 +222,57 @@ Ensure the JSON is valid. Do not wrap in markdown code blocks."""
                 template = PromptTemplate.from_dict(template_data)
                 self.templates[template.name] = template
                 logging.info(f"Loaded prompt template: {template.name} v{template.version}")
-            
+
+            # Rendered prompts may reference replaced templates
+            self._render_cache.clear()
             return True
             
         except Exception as e:
             logging.error(f"Failed to load prompt template from {filepath}: {e}")
             return False
     
+    # Combined cache written next to the per-template files; one parse
+    # replaces N on starts where no template changed
+    COMBINED_CACHE_NAME = "_all_templates.json"
+
     def load_all_from_directory(self, directory: Optional[Path] = None):
         """
         Load all JSON template files from directory.
-        
+
+        A combined cache file is preferred when it is at least as new
+        as every individual template, turning N opens and parses into
+        one. The cache is rewritten after any per-file load.
+
         Args:
             directory: Directory to scan (uses self.prompts_dir if None)
         """
         search_dir = Path(directory) if directory else self.prompts_dir
-        
+
         if not search_dir.exists():
             logging.warning(f"Prompts directory not found: {search_dir}")
             return
-        
+
+        combined = search_dir / self.COMBINED_CACHE_NAME
+        json_files = [p for p in search_dir.glob("*.json")
+                      if p.name != self.COMBINED_CACHE_NAME]
+        if json_files:
+            try:
+                newest = max(p.stat().st_mtime_ns for p in json_files)
+                if combined.exists() and combined.stat().st_mtime_ns >= newest:
+                    if self.load_from_file(combined):
+                        logging.info(f"Loaded combined template cache from {combined}")
+                        return
+            except OSError:
+                pass
+
         loaded_count = 0
-        for json_file in search_dir.glob("*.json"):
+        for json_file in json_files:
             if self.load_from_file(json_file):
                 loaded_count += 1
-        
+
+        if loaded_count:
+            self.export_all_templates(combined)
+
         logging.info(f"Loaded {loaded_count} template files from {search_dir}")
     
     def get_template(self, name: str) -> Optional[PromptTemplate]:
@@ -222,49 +317,45 @@ Ensure the JSON is valid. Do not wrap in markdown code blocks."""
         template = self.templates.get(template_name)
         if not template:
             raise ValueError(f"Template '{template_name}' not found")
-        
-        # Build sections dynamically based on what's provided
-        sections_to_include = {}
-        
-        if persona_instruction:
-            sections_to_include['persona'] = template.sections.get('persona', '')
-        
-        if persona_context:
-            sections_to_include['context'] = template.sections.get('context', '')
-        
-        # Task section is always included
-        if 'task' in template.sections:
-            sections_to_include['task'] = template.sections['task']
-        
-        if history_display:
-            sections_to_include['history'] = template.sections.get('history', '')
-            if include_anti_repetition and 'anti_repetition' in template.sections:
-                sections_to_include['anti_repetition'] = template.sections['anti_repetition']
-        
-        if user_message:
-            sections_to_include['user_message'] = template.sections.get('user_message', '')
-        
-        # Output format is always included
-        if 'output_format' in template.sections:
-            sections_to_include['output_format'] = template.sections['output_format']
-        
-        # Render each section
+
+        # Identical inputs produce identical prompts; serve from the LRU
+        cache_key = (template_name, persona_instruction, persona_context,
+                     history_display, user_message, include_anti_repetition)
+        cached = self._render_cache.get(cache_key)
+        if cached is not None:
+            self._render_cache.move_to_end(cache_key)
+            return cached
+
+        # One walk over the precompiled (name, renderer, gate) tuples.
+        # Canonical ordering keeps static sections first for
+        # provider-side prompt caching; gates skip sections whose
+        # variable is empty; renderer None means the raw text is
+        # appended with no format work at all.
+        variables = {
+            'persona_instruction': persona_instruction,
+            'persona_context': persona_context,
+            'history_display': history_display,
+            'user_message': user_message,
+        }
         result = []
-        for key, section_template in sections_to_include.items():
-            try:
-                rendered = section_template.format(
-                    persona_instruction=persona_instruction,
-                    persona_context=persona_context,
-                    history_display=history_display,
-                    user_message=user_message
-                )
-                if rendered.strip():
-                    result.append(rendered)
-            except KeyError as e:
-                logging.warning(f"Missing variable in section {key}: {e}")
-                result.append(section_template)
-        
-        return "\n\n".join(result)
+        for name, renderer, gate in template._section_order:
+            if gate is not None and not variables[gate]:
+                continue
+            if name == 'anti_repetition' and not (
+                    history_display and include_anti_repetition):
+                continue
+            if renderer is None:
+                result.append(template.sections[name])
+                continue
+            rendered = renderer(variables)
+            if rendered.strip():
+                result.append(rendered)
+
+        prompt = "\n\n".join(result)
+        self._render_cache[cache_key] = prompt
+        while len(self._render_cache) > 64:
+            self._render_cache.popitem(last=False)
+        return prompt
     
     def save_template(self, template: PromptTemplate, filepath: Path):
         """
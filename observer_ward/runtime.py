@@ -0,0 +1,295 @@
+"""Shared runtime helpers for the application entry points.
+
+Canonical home for the console, interrupt machinery, history I/O and
+display helpers so every entry point imports one copy instead of
+carrying its own near-identical functions.
+"""
+
+import os
+import time
+import queue
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List
+from rich.console import Console
+from rich.style import Style
+
+from ._jsonfast import dumps as _json_dumps, loads as _json_loads
+
+# Paths (package lives one level below the project root)
+HISTORY_FILE = Path(__file__).parent.parent.resolve() / ".ai_commentator_history.jsonl"
+LEGACY_HISTORY_FILE = Path(__file__).parent.parent.resolve() / ".ai_commentator_history.json"
+CONFIG_FILE = Path(__file__).parent.parent.resolve() / "config.json"
+
+# Console for application output
+console = Console(emoji=False, force_terminal=True, color_system="truecolor")
+
+chat_active = threading.Event()
+
+# Interrupt flags guarded by a Condition. Setting a flag and waking
+# waiters happens under one lock, so a second request can't be lost to
+# the clear() that follows a wake-up (the race an Event pair had).
+FLAG_MENU = 1
+FLAG_CHAT = 2
+interrupt_cv = threading.Condition()
+_interrupt_flags = 0
+
+
+def _signal_interrupt(flag: int) -> None:
+    global _interrupt_flags
+    with interrupt_cv:
+        _interrupt_flags |= flag
+        interrupt_cv.notify_all()
+
+
+def request_menu() -> None:
+    """Signal a menu request and wake the observer loop immediately."""
+    _signal_interrupt(FLAG_MENU)
+
+
+def request_chat() -> None:
+    """Signal a chat request and wake the observer loop immediately."""
+    _signal_interrupt(FLAG_CHAT)
+
+
+def consume_interrupts() -> int:
+    """Atomically fetch and clear the pending interrupt flags."""
+    global _interrupt_flags
+    with interrupt_cv:
+        flags = _interrupt_flags
+        _interrupt_flags = 0
+        return flags
+
+
+def setup_keyboard_listener():
+    """Sets up global hotkeys for menu and chat.
+
+    Uses pynput's GlobalHotKeys (OS-registered: RegisterHotKey on Win32,
+    XGrabKey on X11) rather than a raw Listener, so the process only
+    wakes for the bound combinations — a Listener would invoke a Python
+    callback for every keystroke system-wide.
+    """
+    def on_menu():
+        console.print("[bold magenta]Hotkey Detected: Menu[/bold magenta]")
+        request_menu()
+
+    def on_chat():
+        console.print("[bold magenta]Hotkey Detected: Chat[/bold magenta]")
+        request_chat()
+
+    # Use GlobalHotKeys for reliable modifier handling
+    try:
+        from pynput import keyboard
+        # Define hotkeys: <ctrl>+<alt>+x for Menu, <ctrl>+<alt>+c for Chat
+        hotkeys = keyboard.GlobalHotKeys({
+            '<ctrl>+<alt>+x': on_menu,
+            '<ctrl>+<alt>+c': on_chat
+        })
+        hotkeys.start()
+        return True
+    except Exception as e:
+        console.print(f"[red]Failed to setup global hotkeys: {e}[/red]")
+        return False
+
+
+def load_history(max_entries: int = None) -> List[Dict[str, str]]:
+    """
+    Load commentary history from the JSONL history file.
+
+    Migrates the legacy single-JSON file on first run if present.
+
+    Args:
+        max_entries: If given, only the trailing max_entries lines are
+            parsed — the rest of the (append-only, unbounded) file is
+            skipped without JSON decoding.
+
+    Returns:
+        List of history entries with timestamp and comment fields.
+    """
+    # EAFP: open directly instead of a separate exists() stat per file
+    entries = []
+    try:
+        with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
+            # Keep only the tail before parsing; deque(maxlen) drops
+            # older raw lines in C without decoding them
+            lines = deque(f, maxlen=max_entries) if max_entries else f.readlines()
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entries.append(_json_loads(line))
+            except ValueError as e:
+                logging.warning(f"Skipping corrupt history line: {e}")
+        return entries
+    except FileNotFoundError:
+        pass
+    except IOError as e:
+        logging.warning(f"Failed to load history: {e}")
+        return entries
+
+    # One-shot migration from the old full-JSON format
+    try:
+        with open(LEGACY_HISTORY_FILE, 'r', encoding='utf-8') as f:
+            entries = _json_loads(f.read())
+        with open(HISTORY_FILE, 'w', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(_json_dumps(entry) + '\n')
+        logging.info(f"Migrated {len(entries)} history entries to JSONL")
+        return entries
+    except FileNotFoundError:
+        pass
+    except (ValueError, IOError) as e:
+        logging.warning(f"Failed to migrate legacy history: {e}")
+    return []
+
+
+# fsync the history file at most this often; appends are otherwise
+# left to the OS page cache.
+HISTORY_FSYNC_INTERVAL_SECONDS = 5.0
+
+_last_history_fsync = 0.0
+
+
+def append_history_entry(entry: Dict[str, str]) -> None:
+    """
+    Append a single history entry to the JSONL history file.
+
+    O(1) per call regardless of history size; fsync is debounced.
+
+    Args:
+        entry: History entry to append.
+    """
+    global _last_history_fsync
+    try:
+        with open(HISTORY_FILE, 'a', encoding='utf-8') as f:
+            f.write(_json_dumps(entry) + '\n')
+            now = time.monotonic()
+            if now - _last_history_fsync >= HISTORY_FSYNC_INTERVAL_SECONDS:
+                f.flush()
+                os.fsync(f.fileno())
+                _last_history_fsync = now
+    except IOError as e:
+        logging.error(f"Failed to save history: {e}")
+
+
+class HistoryWriter:
+    """
+    Appends history entries on a background daemon thread.
+
+    The observer loop calls submit() with each new entry so the hot path
+    never blocks on disk I/O. Call commit() on shutdown to flush pending
+    entries.
+    """
+    def __init__(self):
+        self._queue: "queue.Queue[Dict[str, str]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, entry: Dict[str, str]) -> None:
+        """Queue a new history entry for appending."""
+        self._queue.put(entry)
+
+    def _run(self) -> None:
+        while True:
+            entry = self._queue.get()
+            append_history_entry(entry)
+            self._queue.task_done()
+
+    def commit(self) -> None:
+        """Block until all queued entries have been written to disk."""
+        self._queue.join()
+
+
+def sleep_until_next(iteration_start: float, interval_seconds: float) -> bool:
+    """
+    Sleep until the next iteration should begin, interruptible by pending
+    menu/chat interrupts.
+
+    The wait leaves the flags set; the caller drains them with
+    consume_interrupts(), so an interrupt arriving mid-sleep is never
+    cleared before it is handled.
+
+    Args:
+        iteration_start: Monotonic timestamp when the iteration started.
+        interval_seconds: Target interval between iterations.
+
+    Returns:
+        True if interrupted, False if the timeout completed.
+    """
+    timeout = interval_seconds - (time.monotonic() - iteration_start)
+    if timeout <= 0:
+        # Already past the deadline; don't touch the condition machinery
+        return False
+
+    with interrupt_cv:
+        return interrupt_cv.wait_for(lambda: _interrupt_flags != 0, timeout=timeout)
+
+
+# Panel title templates, built once so per-call work is just substitution
+_TITLE_TEMPLATE = "[dim]{}[/dim]"
+_TITLE_CACHED_TEMPLATE = "[dim]{} (cached)[/dim]"
+
+# Parsed once; Rich skips style-string parsing when given Style objects
+_PANEL_STYLE = Style.parse("white on black")
+_PANEL_BORDER_STYLE = Style.parse("bright_blue")
+
+
+def display_comment(comment: str, now_str: str, is_cached: bool = False) -> None:
+    """
+    Display a comment in a formatted panel.
+
+    Args:
+        comment: The comment text to display.
+        now_str: Timestamp string for the panel title.
+        is_cached: Whether this comment is from cache.
+    """
+    # Imported here so startup doesn't pay for rich.panel before the
+    # first comment is ever displayed
+    from rich.panel import Panel
+
+    console.rule()
+    title = (_TITLE_CACHED_TEMPLATE if is_cached else _TITLE_TEMPLATE).format(now_str)
+    console.print(Panel(
+        comment,
+        title=title,
+        style=_PANEL_STYLE,
+        border_style=_PANEL_BORDER_STYLE,
+        expand=False
+    ))
+
+
+@contextmanager
+def maybe_time(label: str, threshold_ms: float = 100.0):
+    """
+    Time the wrapped block and log it at DEBUG when it exceeds the
+    threshold. When DEBUG is disabled, the block runs with no clock
+    reads at all.
+
+    Args:
+        label: Name used in the log line.
+        threshold_ms: Only durations above this are logged.
+    """
+    if not logging.getLogger().isEnabledFor(logging.DEBUG):
+        yield
+        return
+    t0 = time.monotonic()
+    try:
+        yield
+    finally:
+        elapsed_ms = (time.monotonic() - t0) * 1000
+        if elapsed_ms > threshold_ms:
+            logging.debug("Perf: %s=%.1fms", label, elapsed_ms)
+
+
+def flush_input():
+    """Flush stdin buffer to remove queued keystrokes"""
+    try:
+        import msvcrt
+        while msvcrt.kbhit():
+            msvcrt.getch()
+    except ImportError:
+        pass
@@ -1,36 +1,231 @@
+import threading
+from io import BytesIO
+
 import mss
+import numpy as np
 from PIL import Image
-from typing import Optional
+from typing import Optional, Tuple
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+from .metrics import METRICS
 
 class Screenshotter:
+    """Thread-safe screenshot helper.
+
+    mss contexts are not shareable across threads, so one context is
+    lazily created per thread and reused for every grab from that thread.
+    A single Screenshotter instance can therefore be shared by the
+    capture worker and the chat callback without re-entering mss.mss()
+    per call.
+    """
     def __init__(self):
-        self.sct = mss.mss()
+        self._tls = threading.local()
+        self._contexts = []
+        self._contexts_lock = threading.Lock()
+        # Packed 64-bit dHash of the last frame handed out by the
+        # skip-unchanged path
+        self._last_hash: Optional[int] = None
+
+    def _get_sct(self) -> mss.base.MSSBase:
+        sct = getattr(self._tls, 'sct', None)
+        if sct is None:
+            sct = mss.mss()
+            self._tls.sct = sct
+            with self._contexts_lock:
+                self._contexts.append(sct)
+        return sct
+
+    def _get_monitors(self, sct: mss.base.MSSBase) -> list:
+        # sct.monitors triggers a platform display enumeration (RandR /
+        # EnumDisplayMonitors) on every access; cache per thread and
+        # refresh only when a grab fails
+        monitors = getattr(self._tls, 'monitors', None)
+        if monitors is None:
+            monitors = list(sct.monitors)
+            self._tls.monitors = monitors
+        return monitors
+
+    def refresh_monitors(self) -> list:
+        """Re-enumerates displays for the calling thread.
+
+        Call after a grab failure — the cached geometry goes stale when
+        monitors are plugged, unplugged or rearranged.
+        """
+        self._tls.monitors = list(self._get_sct().monitors)
+        return self._tls.monitors
+
+    @staticmethod
+    def _resize_filter(src_size: Tuple[int, int],
+                       dst_size: Tuple[int, int]) -> Image.Resampling:
+        # LANCZOS's 8-tap kernel is overkill for vision-model input.
+        # BOX (plain averaging) is cheapest and fine for heavy
+        # downscales; BILINEAR covers everything else.
+        if src_size[0] >= dst_size[0] * 2 and src_size[1] >= dst_size[1] * 2:
+            return Image.Resampling.BOX
+        return Image.Resampling.BILINEAR
+
+    @staticmethod
+    def _pick_monitor(monitors: list, monitor_index: int) -> dict:
+        if monitor_index < 1 or monitor_index >= len(monitors):
+            return monitors[1]  # Fallback to primary
+        return monitors[monitor_index]
+
+    def _grab(self, monitor_index: int) -> Image.Image:
+        """Grabs the raw monitor image at native resolution."""
+        sct = self._get_sct()
+        monitor = self._pick_monitor(self._get_monitors(sct), monitor_index)
+
+        try:
+            sct_img = sct.grab(monitor)
+        except mss.exception.ScreenShotError:
+            # Display layout may have changed; re-enumerate and retry
+            monitor = self._pick_monitor(self.refresh_monitors(), monitor_index)
+            sct_img = sct.grab(monitor)
+
+        # Wrap the raw BGRA buffer without copying, then shuffle the
+        # reversed-channel view into a preallocated per-thread RGB
+        # buffer. The copy is numpy's vectorized strided copy rather
+        # than Pillow's scalar BGRX unpacker, the padding byte is
+        # dropped by the view, and reusing the destination avoids a
+        # full-frame allocation per grab. fromarray copies RGB data
+        # into the image, so the shared buffer is safe to overwrite on
+        # the next frame.
+        h, w = sct_img.height, sct_img.width
+        arr = np.frombuffer(sct_img.raw, dtype=np.uint8).reshape(h, w, 4)
+        buf = getattr(self._tls, 'rgb_buf', None)
+        if buf is None or buf.shape[:2] != (h, w):
+            buf = np.empty((h, w, 3), np.uint8)
+            self._tls.rgb_buf = buf
+        if cv2 is not None:
+            # OpenCV's cvtColor does the same shuffle with SIMD
+            # (SSE2/AVX2/NEON) loads and stores
+            cv2.cvtColor(arr, cv2.COLOR_BGRA2RGB, dst=buf)
+        else:
+            buf[...] = arr[:, :, 2::-1]
+        return Image.fromarray(buf)
 
     def take_screenshot(self, monitor_index: int = 1, width: int = 1000, height: int = 1080) -> Optional[Image.Image]:
-        """Captures a screenshot using the persistent MSS instance."""
+        """Captures a screenshot using the per-thread MSS instance."""
         try:
-            monitors = self.sct.monitors
-            # Ensure monitor index is valid
-            if monitor_index < 1 or monitor_index >= len(monitors):
-                monitor = monitors[1] # Fallback to primary
-            else:
-                monitor = monitors[monitor_index]
-                
-            sct_img = self.sct.grab(monitor)
-            img = Image.frombytes("RGB", sct_img.size, sct_img.bgra, "raw", "BGRX")
-            
+            img = self._grab(monitor_index)
+
             if img.size != (width, height):
-                img = img.resize((width, height), Image.Resampling.LANCZOS)
-                
+                img = img.resize((width, height),
+                                 self._resize_filter(img.size, (width, height)))
+
             return img
         except Exception as e:
             print(f"Screenshot error: {e}")
             return None
 
+    def _frame_changed(self, img: Image.Image, threshold: int = 5) -> bool:
+        """dHash the frame and compare against the previous one.
+
+        The hash runs on a 9x8 grayscale thumbnail — well under a
+        millisecond — while a skipped vision round trip saves seconds
+        of latency plus token cost. Hamming distance below the
+        threshold counts as unchanged.
+        """
+        thumb = img.resize((9, 8), Image.Resampling.BILINEAR).convert("L")
+        g = np.asarray(thumb, dtype=np.int16)
+        bits = np.packbits(g[:, 1:] > g[:, :-1])
+        h = int.from_bytes(bits.tobytes(), "big")
+        last = self._last_hash
+        self._last_hash = h
+        if last is None:
+            return True
+        return (h ^ last).bit_count() >= threshold
+
+    def take_screenshot_jpeg(
+        self,
+        monitor_index: int = 1,
+        width: int = 1000,
+        height: int = 1080,
+        quality: int = 85,
+        skip_unchanged: bool = False
+    ) -> Optional[bytes]:
+        """Captures a screenshot and encodes it to JPEG in one step.
+
+        For callers that ship the frame straight over the network the
+        PIL image is a dead intermediate; encoding at capture time
+        avoids holding the decoded frame and a later second encode
+        pass. The encode buffer is per-thread and reused across calls.
+
+        With skip_unchanged, frames whose dHash is within a small
+        Hamming distance of the previous frame return None (and count
+        as silent skips) so the caller can drop the API call entirely.
+        The observer loop does this through ChangeDetector already;
+        this gate serves the simple capture-to-bytes callers.
+        """
+        img = self.take_screenshot(monitor_index, width, height)
+        if img is None:
+            return None
+        if skip_unchanged and not self._frame_changed(img):
+            METRICS.silent_skip_count += 1
+            return None
+        buf = getattr(self._tls, 'jpeg_buf', None)
+        if buf is None:
+            buf = BytesIO()
+            self._tls.jpeg_buf = buf
+        buf.seek(0)
+        buf.truncate()
+        img.save(buf, format="JPEG", quality=quality)
+        return buf.getvalue()
+
+    def take_screenshot_with_thumb(
+        self,
+        monitor_index: int = 1,
+        width: int = 1000,
+        height: int = 1080,
+        thumb_size: int = 64
+    ) -> Tuple[Optional[Image.Image], Optional[Image.Image]]:
+        """Captures a screenshot plus a small hash thumbnail in one grab.
+
+        The thumbnail is scaled straight from the raw grab, so hashing
+        never re-reads the display-size pixel buffer a second time.
+        """
+        try:
+            img = self._grab(monitor_index)
+            thumb = img.resize((thumb_size, thumb_size), Image.Resampling.BILINEAR)
+
+            if img.size != (width, height):
+                img = img.resize((width, height),
+                                 self._resize_filter(img.size, (width, height)))
+
+            return img, thumb
+        except Exception as e:
+            print(f"Screenshot error: {e}")
+            return None, None
+
     def close(self):
-        self.sct.close()
+        """Closes the calling thread's MSS context, if any."""
+        sct = getattr(self._tls, 'sct', None)
+        if sct is not None:
+            sct.close()
+            self._tls.sct = None
+            self._tls.monitors = None
+
+    def close_all(self):
+        """Closes every context this instance created, across all threads.
+
+        Call at shutdown from any thread; per-thread contexts created by
+        worker or chat-callback threads would otherwise linger until
+        process exit.
+        """
+        with self._contexts_lock:
+            contexts, self._contexts = self._contexts, []
+        for sct in contexts:
+            try:
+                sct.close()
+            except Exception:
+                pass
+        self._tls.sct = None
+        self._tls.monitors = None
 
 # Global instance for backward compatibility if needed, but better to instantiate in main
-# def take_screenshot(...) -> ... 
+# def take_screenshot(...) -> ...
 # We will update main.py to use the class directly.
-
@@ -4,10 +4,47 @@ Style Persistence Module
 Handles reading and writing styles to styles.json.
 """
 
-import json
+import atexit
+import heapq
 import logging
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, Optional, Tuple
+
+from ._jsonfast import loads as json_loads, dumps_bytes as json_dumps_bytes
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# record_usage coalesces increments for this long before writing
+STATS_FLUSH_DELAY_SECONDS = 2.0
+
+
+def _atomic_write_bytes(path: Path, data: bytes) -> None:
+    """Writes a pre-serialized buffer to path atomically.
+
+    One write() of the whole buffer into a same-directory tempfile,
+    then os.replace — a crash mid-write can never leave a torn file,
+    and readers only ever see the old or the new content.
+    """
+    tmp = tempfile.NamedTemporaryFile(dir=path.parent, delete=False)
+    try:
+        tmp.write(data)
+        tmp.close()
+        os.replace(tmp.name, path)
+    except BaseException:
+        tmp.close()
+        try:
+            os.unlink(tmp.name)
+        except OSError:
+            pass
+        raise
 
 
 class StylePersistence:
@@ -16,11 +53,52 @@ class StylePersistence:
     def __init__(self, styles_file: Path):
         """
         Initialize the persistence manager.
-        
+
         Args:
             styles_file: Path to styles.json
         """
         self.styles_file = styles_file
+        # Parsed file contents keyed by path; entries are reused while
+        # (st_mtime_ns, st_size) is unchanged, so warm loads cost one
+        # stat instead of a read and a JSON parse
+        self._file_cache: Dict[Path, tuple] = {}
+
+        # Usage stats are mutated in memory and flushed on a short
+        # timer, so a burst of record_usage calls costs one file write
+        self._stats_cache: Optional[dict] = None
+        self._stats_dirty = False
+        self._stats_lock = threading.Lock()
+        self._flush_timer: Optional[threading.Timer] = None
+        atexit.register(self._flush_stats)
+
+        # Last (monotonic time, isoformat string); usage events landing
+        # within a millisecond of each other reuse the formatted string
+        self._ts_cache: Tuple[float, str] = (0.0, "")
+
+        # Memory-only heap of (-count, name) mirroring the stats cache.
+        # record_usage pushes a fresh entry per increment and leaves the
+        # old one behind; readers treat an entry as live only while its
+        # count still matches, so nothing is ever searched or removed
+        # in place. Rebuilt from scratch whenever stats load from disk.
+        self._counts_heap: Optional[list] = None
+
+    def _cache_get(self, path: Path):
+        try:
+            st = path.stat()
+        except OSError:
+            return None, None
+        key = (st.st_mtime_ns, st.st_size)
+        cached = self._file_cache.get(path)
+        if cached is not None and cached[0] == key:
+            return key, cached[1]
+        return key, None
+
+    def _cache_put(self, path: Path, key, value) -> None:
+        if key is not None:
+            self._file_cache[path] = (key, value)
+
+    def _cache_invalidate(self, path: Path) -> None:
+        self._file_cache.pop(path, None)
     
     def load_styles(self) -> Dict[str, Dict[str, str]]:
         """
@@ -36,9 +114,13 @@ class StylePersistence:
                 logging.warning(f"Styles file not found: {self.styles_file}")
                 return {}
 
-            with open(self.styles_file, 'r', encoding='utf-8') as f:
-                raw_styles = json.load(f)
-            
+            key, cached = self._cache_get(self.styles_file)
+            if cached is not None:
+                return cached
+
+            with open(self.styles_file, 'rb') as f:
+                raw_styles = json_loads(f.read())
+
             # Convert simple key-value to detailed format if needed by UI
             # The UI expects {name: {"role": "system", "content": "..."}}
             detailed_styles = {}
@@ -52,9 +134,10 @@ class StylePersistence:
                         "role": "system",
                         "content": content
                     }
-            
+
+            self._cache_put(self.styles_file, key, detailed_styles)
             return detailed_styles
-            
+
         except Exception as e:
             logging.error(f"Failed to load styles: {e}")
             return {}
@@ -78,11 +161,12 @@ class StylePersistence:
                 else:
                     simple_styles[name] = str(data)
             
-            with open(self.styles_file, 'w', encoding='utf-8') as f:
-                json.dump(simple_styles, f, ensure_ascii=False, indent=4)
-            
+            _atomic_write_bytes(self.styles_file,
+                                json_dumps_bytes(simple_styles, indent=True))
+
+            self._cache_invalidate(self.styles_file)
             return True
-            
+
         except Exception as e:
             logging.error(f"Failed to save styles: {e}")
             return False
@@ -120,9 +204,14 @@ class StylePersistence:
         favorites_file = self.styles_file.parent / ".favorites.json"
         try:
             if favorites_file.exists():
-                with open(favorites_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    return data.get("favorites", [])
+                key, cached = self._cache_get(favorites_file)
+                if cached is not None:
+                    return cached
+                with open(favorites_file, 'rb') as f:
+                    data = json_loads(f.read())
+                favorites = data.get("favorites", [])
+                self._cache_put(favorites_file, key, favorites)
+                return favorites
         except Exception as e:
             logging.error(f"Failed to load favorites: {e}")
         return []
@@ -139,8 +228,9 @@ class StylePersistence:
         """
         favorites_file = self.styles_file.parent / ".favorites.json"
         try:
-            with open(favorites_file, 'w', encoding='utf-8') as f:
-                json.dump({"favorites": favorites}, f, ensure_ascii=False, indent=2)
+            _atomic_write_bytes(favorites_file,
+                                json_dumps_bytes({"favorites": favorites}, indent=True))
+            self._cache_invalidate(favorites_file)
             return True
         except Exception as e:
             logging.error(f"Failed to save favorites: {e}")
@@ -176,8 +266,6 @@ class StylePersistence:
             Path to exported file, or None if failed
         """
         try:
-            from datetime import datetime
-            
             if export_path is None:
                 # Create exports directory
                 exports_dir = self.styles_file.parent / "exports"
@@ -199,8 +287,8 @@ class StylePersistence:
             }
             
             # Write to file
-            with open(export_path, 'w', encoding='utf-8') as f:
-                json.dump(export_data, f, ensure_ascii=False, indent=2)
+            _atomic_write_bytes(export_path,
+                                json_dumps_bytes(export_data, indent=True))
             
             return export_path
             
@@ -215,14 +303,29 @@ class StylePersistence:
         Args:
             import_path: Path to import file
             merge: If True, merge with existing; if False, replace
-            
+
         Returns:
             Merged/imported styles dict, or None if failed
         """
         try:
-            with open(import_path, 'r', encoding='utf-8') as f:
-                import_data = json.load(f)
-            
+            if merge and ijson is not None:
+                # Stream straight off the file: only the styles we are
+                # actually going to add get materialized, so merging a
+                # huge export into a mostly-overlapping library never
+                # parses the whole document into memory
+                existing = self.load_styles()
+                with open(import_path, 'rb') as f:
+                    for name, content in ijson.kvitems(f, 'styles'):
+                        if name not in existing:
+                            existing[name] = {
+                                "role": "system",
+                                "content": content
+                            }
+                return existing
+
+            with open(import_path, 'rb') as f:
+                import_data = json_loads(f.read())
+
             imported_simple = import_data.get("styles", {})
             
             # Convert to detailed format
@@ -255,11 +358,20 @@ class StylePersistence:
         Returns:
             Statistics dict with style usage data
         """
+        # Pending in-memory updates are the freshest view
+        if self._stats_cache is not None:
+            return self._stats_cache
+
         stats_file = self.styles_file.parent / ".stats.json"
         try:
             if stats_file.exists():
-                with open(stats_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                key, cached = self._cache_get(stats_file)
+                if cached is not None:
+                    return cached
+                with open(stats_file, 'rb') as f:
+                    stats = json_loads(f.read())
+                self._cache_put(stats_file, key, stats)
+                return stats
         except Exception as e:
             logging.error(f"Failed to load stats: {e}")
         return {"styles": {}}
@@ -276,8 +388,9 @@ class StylePersistence:
         """
         stats_file = self.styles_file.parent / ".stats.json"
         try:
-            with open(stats_file, 'w', encoding='utf-8') as f:
-                json.dump(stats, f, ensure_ascii=False, indent=2)
+            _atomic_write_bytes(stats_file,
+                                json_dumps_bytes(stats, indent=True))
+            self._cache_invalidate(stats_file)
             return True
         except Exception as e:
             logging.error(f"Failed to save stats: {e}")
@@ -286,22 +399,51 @@ class StylePersistence:
     def record_usage(self, style_name: str) -> None:
         """
         Record that a style was just used.
-        
+
+        The increment is applied to the in-memory stats and written out
+        by a short debounce timer (and at exit), so each call is a dict
+        update instead of a full JSON read-modify-write.
+
         Args:
             style_name: Name of the style that was used
         """
-        from datetime import datetime
-        
-        stats = self.load_stats()
-        if "styles" not in stats:
-            stats["styles"] = {}
-        
-        if style_name not in stats["styles"]:
-            stats["styles"][style_name] = {"count": 0, "last_used": None}
-        
-        stats["styles"][style_name]["count"] += 1
-        stats["styles"][style_name]["last_used"] = datetime.now().isoformat()
-        
+        now = time.monotonic()
+        if now - self._ts_cache[0] < 0.001:
+            iso = self._ts_cache[1]
+        else:
+            iso = datetime.now().isoformat()
+            self._ts_cache = (now, iso)
+
+        with self._stats_lock:
+            if self._stats_cache is None:
+                self._stats_cache = self.load_stats()
+            styles = self._stats_cache.setdefault("styles", {})
+            if self._counts_heap is None:
+                self._counts_heap = [(-data.get("count", 0), name)
+                                     for name, data in styles.items()]
+                heapq.heapify(self._counts_heap)
+            entry = styles.setdefault(style_name, {"count": 0, "last_used": None})
+            entry["count"] += 1
+            entry["last_used"] = iso
+            heapq.heappush(self._counts_heap, (-entry["count"], style_name))
+            self._stats_dirty = True
+
+            if self._flush_timer is None:
+                timer = threading.Timer(STATS_FLUSH_DELAY_SECONDS, self._flush_stats)
+                timer.daemon = True
+                timer.start()
+                self._flush_timer = timer
+
+    def _flush_stats(self) -> None:
+        """Write pending stats updates to disk, if any."""
+        with self._stats_lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            if not self._stats_dirty or self._stats_cache is None:
+                return
+            self._stats_dirty = False
+            stats = self._stats_cache
         self.save_stats(stats)
     
     def get_top_styles(self, n: int = 5) -> list:
@@ -316,10 +458,39 @@ class StylePersistence:
         """
         stats = self.load_stats()
         style_stats = stats.get("styles", {})
-        
-        items = [(name, data.get("count", 0)) for name, data in style_stats.items()]
-        items.sort(key=lambda x: x[1], reverse=True)
-        return items[:n]
+
+        with self._stats_lock:
+            if (self._counts_heap is not None
+                    and n < len(style_stats)):
+                # Pop until n live entries surface; stale entries (the
+                # count moved on since they were pushed) are discarded
+                # for good, live ones are pushed back afterwards
+                heap = self._counts_heap
+                result = []
+                seen = set()
+                live = []
+                while heap and len(result) < n:
+                    neg, name = heapq.heappop(heap)
+                    current = style_stats.get(name, {}).get("count", 0)
+                    if name in seen or -neg != current:
+                        continue
+                    seen.add(name)
+                    result.append((name, current))
+                    live.append((neg, name))
+                for item in live:
+                    heapq.heappush(heap, item)
+                return result
+
+        if n >= len(style_stats):
+            # Asking for everything — a plain sort is cheaper than a heap
+            items = [(name, data.get("count", 0)) for name, data in style_stats.items()]
+            items.sort(key=lambda x: x[1], reverse=True)
+            return items
+        # O(len * log n) partial selection instead of sorting the lot
+        return heapq.nlargest(
+            n,
+            ((name, data.get("count", 0)) for name, data in style_stats.items()),
+            key=lambda x: x[1])
 
 
 # Global instance
@@ -3,6 +3,7 @@ Token counting utilities for managing context window limits.
 """
 from typing import List, Dict, Optional
 import logging
+import os
 
 try:
     import tiktoken
@@ -12,6 +13,22 @@ except ImportError:
     logging.warning("tiktoken not installed. Using approximate token counting.")
 
 
+# Shared instances keyed by model name. Loading a BPE table costs
+# hundreds of ms and megabytes of RAM, and the table is identical for
+# every user of the same model, so call sites should go through
+# get_token_counter() instead of constructing their own.
+_SHARED_COUNTERS: Dict[str, "TokenCounter"] = {}
+
+
+def get_token_counter(model: str = "gpt-3.5-turbo") -> "TokenCounter":
+    """Return the process-wide TokenCounter for the given model."""
+    counter = _SHARED_COUNTERS.get(model)
+    if counter is None:
+        counter = TokenCounter(model)
+        _SHARED_COUNTERS[model] = counter
+    return counter
+
+
 class TokenCounter:
     """
     Utility for counting tokens in text.
@@ -52,39 +69,56 @@ class TokenCounter:
             return 0
         
         if self.encoding:
-            return len(self.encoding.encode(text))
+            return len(self.encoding.encode(text, disallowed_special=()))
         else:
             # Approximate: ~4 characters per token
             return len(text) // 4
-    
+
+    def _message_text(self, msg: Dict) -> str:
+        """Extract the countable text of a single message."""
+        if not isinstance(msg, dict):
+            return ""
+        content = msg.get('comment', '') or msg.get('content', '')
+        user_msg = msg.get('user_message', '')
+        return f"{content}{user_msg}"
+
+    def per_message_tokens(self, messages: List[Dict]) -> List[int]:
+        """
+        Count tokens for each message in one pass.
+
+        Uses tiktoken's encode_batch (C++, releases the GIL) when
+        available, so the whole list is tokenized in a single call.
+
+        Args:
+            messages: List of message dictionaries
+
+        Returns:
+            List of per-message token counts including overhead
+        """
+        texts = [self._message_text(msg) for msg in messages]
+
+        if self.encoding:
+            encoded = self.encoding.encode_batch(
+                texts,
+                num_threads=os.cpu_count() or 1,
+                disallowed_special=()
+            )
+            # +4 overhead per message (metadata, structure, etc.)
+            return [len(tokens) + 4 for tokens in encoded]
+
+        return [len(text) // 4 + 4 for text in texts]
+
     def count_message_tokens(self, messages: List[Dict]) -> int:
         """
         Count total tokens in message list.
-        
+
         Args:
             messages: List of message dictionaries
-            
+
         Returns:
             Total token count including overhead
         """
-        total = 0
-        
-        for msg in messages:
-            if isinstance(msg, dict):
-                # Count content tokens
-                content = msg.get('comment', '') or msg.get('content', '')
-                if content:
-                    total += self.count_tokens(str(content))
-                
-                # Count user_message if present
-                user_msg = msg.get('user_message', '')
-                if user_msg:
-                    total += self.count_tokens(str(user_msg))
-                
-                # Add overhead per message (metadata, structure, etc.)
-                total += 4
-        
-        return total
+        return sum(self.per_message_tokens(messages))
     
     def trim_to_token_limit(
         self, 
@@ -107,14 +141,17 @@ class TokenCounter:
         if not messages:
             return []
         
+        # Tokenize the whole list once; the walk below only reads counts
+        counts = self.per_message_tokens(messages)
+
         # Always keep latest messages
         keep_latest = min(keep_latest, len(messages))
         latest = messages[-keep_latest:]
         older = messages[:-keep_latest] if len(messages) > keep_latest else []
-        
+
         # Count tokens in latest messages
-        latest_tokens = self.count_message_tokens(latest)
-        
+        latest_tokens = sum(counts[-keep_latest:])
+
         # If latest messages exceed limit, return only them
         if latest_tokens >= max_tokens:
             logging.warning(
@@ -122,30 +159,28 @@ class TokenCounter:
                 f"exceed limit ({max_tokens} tokens)"
             )
             return latest
-        
+
         # Remaining budget for older messages
         remaining_budget = max_tokens - latest_tokens
-        
+
         # Add older messages from most recent, staying within budget
         trimmed_older = []
         current_tokens = 0
-        
-        for msg in reversed(older):
-            msg_tokens = self.count_message_tokens([msg])
-            
+
+        for msg, msg_tokens in zip(reversed(older), reversed(counts[:len(older)])):
             if current_tokens + msg_tokens <= remaining_budget:
                 trimmed_older.insert(0, msg)
                 current_tokens += msg_tokens
             else:
                 break
-        
+
         result = trimmed_older + latest
-        
+
         logging.debug(
-            f"Trimmed {len(messages)} messages to {len(result)} messages "
-            f"({self.count_message_tokens(result)} tokens)"
+            "Trimmed %d messages to %d messages (%d tokens)",
+            len(messages), len(result), latest_tokens + current_tokens
         )
-        
+
         return result
     
     def estimate_tokens_remaining(
@@ -185,7 +220,7 @@ class TokenCounter:
                 "message_count": 0
             }
         
-        token_counts = [self.count_message_tokens([msg]) for msg in messages]
+        token_counts = self.per_message_tokens(messages)
         
         return {
             "total_tokens": sum(token_counts),
@@ -8,6 +8,7 @@ class TestAppConfig(unittest.TestCase):
     def setUp(self):
         self.temp_dir = tempfile.TemporaryDirectory()
         self.config_path = Path(self.temp_dir.name) / "test_config.json"
+        AppConfig.clear_cache()
 
     def tearDown(self):
         self.temp_dir.cleanup()
@@ -33,6 +34,21 @@ class TestAppConfig(unittest.TestCase):
         self.assertEqual(config.interval_seconds, 30)
         self.assertEqual(config.gemini_model, "gemini-pro-vision")
         
+    def test_load_cached_until_modified(self):
+        with open(self.config_path, 'w', encoding='utf-8') as f:
+            json.dump({"interval_seconds": 30}, f)
+
+        first = AppConfig.load(self.config_path)
+        # Unchanged file: the parsed instance is reused
+        self.assertIs(AppConfig.load(self.config_path), first)
+
+        # Rewriting the file bumps mtime and invalidates the cache
+        with open(self.config_path, 'w', encoding='utf-8') as f:
+            json.dump({"interval_seconds": 45}, f)
+
+        reloaded = AppConfig.load(self.config_path)
+        self.assertEqual(reloaded.interval_seconds, 45)
+
     def test_save(self):
         config = AppConfig(interval_seconds=60)
         config.save(self.config_path)
@@ -1,5 +1,4 @@
 import unittest
-from unittest.mock import MagicMock
 from PIL import Image
 import imagehash
 from observer_ward.hashing import ChangeDetector
@@ -44,29 +43,48 @@ class TestChangeDetector(unittest.TestCase):
         self.assertEqual(decision, "skip")
 
     def test_decide_change_significant_change(self):
-        # Mock hashes to control distance
-        h1 = MagicMock()
-        h2 = MagicMock()
-        # Define subtraction to return a large distance
-        h1.__sub__.return_value = 10 # > threshold (7)
-        h2.__sub__.return_value = 10
-        
-        # We need to set internal state manually or mock compute_hash because 
-        # we can't easily make real images that produce these exact mock objects via compute_hash
+        # Build hashes with a controlled Hamming distance of 10 (> 7)
+        import numpy as np
+        bits1 = np.zeros((8, 8), dtype=bool)
+        bits2 = np.zeros((8, 8), dtype=bool)
+        bits2.flat[:10] = True
+        h1 = imagehash.ImageHash(bits1)
+        h2 = imagehash.ImageHash(bits2)
+
         self.detector.last_hash = h1
         self.detector.last_change_monotonic = 0
-        
-        # We need to simulate that compute_hash returned h2
-        # But decide_change takes the hash as input, so we just pass h2
-        
-        # However, inside decide_change: dist = self.last_hash - curr_hash
-        # So h1 - h2 should be >= threshold.
-        # Let's configure h1 to return 10 when subtracted by h2
-        h1.__sub__ = MagicMock(return_value=10)
-        
+
         decision = self.detector.decide_change(h2, self.config)
         self.assertEqual(decision, "call")
         self.assertEqual(self.detector.last_hash, h2)
 
+    def test_similar_screen_reuses_cached_comment(self):
+        # First screen: call + cache the comment
+        h1 = self.detector.compute_hash(self.img1)
+        self.assertEqual(self.detector.decide_change(h1, self.config), "call")
+        self.detector.cache_set("cached comment", ttl=60, disable_cache=False)
+
+        # A very different screen triggers a new call
+        h2 = self.detector.compute_hash(self.img2)
+        self.assertEqual(self.detector.decide_change(h2, self.config), "call")
+        self.detector.cache_set("other comment", ttl=60, disable_cache=False)
+
+        # Returning to a screen near the first one should hit the
+        # similarity cache instead of calling the API again
+        import numpy as np
+        h3 = imagehash.ImageHash(np.zeros((8, 8), dtype=bool))  # packs to 0
+        # Force a "changed" decision versus the last hash (all bits set:
+        # Hamming distance 64 from h3)
+        self.detector.last_hash = imagehash.ImageHash(np.ones((8, 8), dtype=bool))
+        self.detector._last_int = None
+        # Give the stored entries controlled Hamming distances to h3
+        for key, (cached_int, comment, expiry) in list(self.detector.similar_cache.items()):
+            dist_bits = 0b1 if comment == "cached comment" else 0b11111111
+            self.detector.similar_cache[key] = (dist_bits, comment, expiry)
+
+        decision = self.detector.decide_change(h3, self.config)
+        self.assertEqual(decision, "use_cache")
+        self.assertEqual(self.detector.cache_get(disable_cache=False), "cached comment")
+
 if __name__ == '__main__':
     unittest.main()